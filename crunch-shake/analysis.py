@@ -1,17 +1,29 @@
 import networkx as nx
 
-from lines import Dialogue, Character, Instruction, Act, Scene
-from utils import create_remove_punctuation, get_matcher
-
-def get_characters_by_importance(play_lines, speaking_characters, graph,
-        reciprocal_graph, metrics_weight=[0.625, 0.125, 0.125, 0.125]):
-    reverse_graph = graph.reverse(copy=True)
-
+from tokenizer import (create_tokenizer, create_phrase_tagger,
+        PLAIN_WORD_PATTERN)
+from table import iter_dialogue
+from centrality import sparse_centrality
+from scenes import SceneIndex
+from vocab import VocabIndex
+from instrument import span, count
+
+# weights of the number of lines, out degree, PageRank and betweenness
+METRICS_WEIGHT = [0.625, 0.125, 0.125, 0.125]
+
+def get_characters_by_importance(play_lines, speaking_characters, adj_num,
+        metrics_weight=METRICS_WEIGHT, backend='sparse', **options):
+    """ Rank characters by a weighted sum of their number of lines, out
+    degree, PageRank and betweenness centrality, least important first.
+
+    backend names the function in CENTRALITY_BACKENDS that computes the
+    centrality metrics from adj_num, and options are passed on to it (tol,
+    the PageRank tolerance; k and seed, to sample k betweenness pivots).
+    """
     # METRICS
     lines_by_character = get_lines_by_character(play_lines, speaking_characters)
-    out_degree = nx.out_degree_centrality(graph)
-    page_rank = nx.pagerank_numpy(reverse_graph)
-    betweenness = nx.betweenness_centrality(reciprocal_graph)
+    out_degree, page_rank, betweenness = CENTRALITY_BACKENDS[backend](
+            adj_num, **options)
 
     metrics = [lines_by_character, out_degree, page_rank, betweenness]
 
@@ -32,9 +44,8 @@ def scale(x, a):
 
 def get_lines_by_character(play_lines, speaking_characters):
     lines_by_character = { key : 0 for key in speaking_characters }
-    for line in play_lines:
-        if line.TYPE == Dialogue.TYPE:
-            lines_by_character[line.character] += 1
+    for _, character, _ in iter_dialogue(play_lines):
+        lines_by_character[character] += 1
     return lines_by_character
 
 def normalize_linear(x):
@@ -67,6 +78,20 @@ def create_graph(adj_num, reciprocal=False):
     graph.add_edges_from(edges)
     return graph
 
+def networkx_centrality(adj_num, tol=1e-10, k=None, seed=None):
+    """ NetworkX equivalent of `centrality.sparse_centrality` """
+    graph = create_graph(adj_num)
+    reciprocal_graph = create_graph(adj_num, reciprocal=True)
+    out_degree = nx.out_degree_centrality(graph)
+    page_rank = nx.pagerank(graph.reverse(copy=True), tol=tol)
+    betweenness = nx.betweenness_centrality(reciprocal_graph, k=k, seed=seed)
+    return out_degree, page_rank, betweenness
+
+CENTRALITY_BACKENDS = {
+        'sparse' : sparse_centrality,
+        'networkx' : networkx_centrality,
+        }
+
 # BECHDEL TEST
 
 """ 
@@ -82,11 +107,11 @@ when speaking to another women.
 
 2. they must not mention words relating to male partners.
 
-SEE `create_forbidden_matcher`
+SEE `get_forbidden_words` and `create_forbidden_tagger`
 
 3. they must not mention words related to sexual relationships
 
-SEE `create_forbidden_matcher`
+SEE `get_forbidden_words` and `create_forbidden_tagger`
 
 In place of whether the two women are named, both women must be in the upper
 50% of characters as given by character by importance.  
@@ -95,83 +120,82 @@ Note:
     If there are no females in the upper 50% of characters, it retuns 0%.
 """
 
-def bechdel_test(play_lines, notable, forbidden_matcher, adj,
-        act_scene_start_end, play_stats, prefix):
-    gender_to_gender = sorted([ line 
-            for speaker in notable
-            for spoken in notable - {speaker} 
-            for line in adj[speaker].get(spoken, [])])
-    gender_lines_by_scene = get_gender_lines_by_scene(gender_to_gender,
-            act_scene_start_end)
-    blacklist_name = prefix + 'blacklist'
-    play_stats[blacklist_name] = 0
-    bechdel_scenes = [ bechdel_by_scene(start, end, play_lines,
-        gender_to_gender, forbidden_matcher, play_stats, blacklist_name)
-        for start, end in gender_lines_by_scene ]
-    # Abusing the fact that True is one
-    play_stats[prefix + 'passes'] = sum(bechdel_scenes)
-    bechdel_percent = sum(bechdel_scenes) / len(act_scene_start_end)
-    return bechdel_scenes, bechdel_percent
-
-def get_gender_lines_by_scene(gender_to_gender, act_scene_start_end):
-    """ for each scene in play, get the range of lines in female_to_female
-    which belong to that scene. As is in common, the range is defined to be
-    (inclusive, exclusive).
-
-    For example:
-    if 
-    >>> gender_to_gender = [0, 1, 3, 8, 9, 10, 11, 100, 101]
-    >>> act_scene_start_end = [(0, 10), (10, 30), (30, 80), (80, 102)]
-
-    then after 
-    >>> gender_lines_by_scene = [ lines_by_scene(gender_to_gender, end) for _ ,
-            end in act_scene_start_end ]
-    >>> gender_lines_by_scene == [(0, 5), (5, 7), (7,7), (7,9)]
+GENDER_PREFIX = {'F' : 'female ', 'M' : 'male ', 'N' : 'unisex '}
+
+# The genders that a conversation between characters of a gender must not be
+# about
+OTHER_GENDERS = {'F' : ['M'], 'M' : ['F'], 'N' : ['F', 'M']}
+
+def bechdel_test(play_lines, notable, tag, adj, scene_index, play_stats):
+    """ Run the test for every gender at once.
+
+    Parameters
+    ----------
+    notable : dict
+        maps gender letter to the set of its notable characters
+    tag : function
+        tag(dialogue) gives the gender letters that dialogue is forbidden for,
+        see `create_forbidden_tagger`
+    scene_index : SceneIndex
+        of the play's scenes
+
+    Returns
+    -------
+    bechdel : dict
+        maps gender letter to (bechdel_scenes, bechdel_percent)
+
+    Notes
+    -----
+    Each line of dialogue between notable characters is tagged once, however
+    many genders it concerns, and then each scene is tested for every gender
+    in a single pass over the scenes.
     """
-    class LinesByScenes:
-        def __init__(self):
-            self.left_marker = 0
-            self.reached_end = False
-
-        def __call__(self, gender_to_gender, end):
-            if self.reached_end:
-                return (len(gender_to_gender), len(gender_to_gender))
-            for i in range(self.left_marker, len(gender_to_gender)):
-                line_n = gender_to_gender[i]
-                if line_n >= end:
-                    line_range = (self.left_marker, i)
-                    self.left_marker = i
-                    return line_range
-            self.reached_end = True
-            return (self.left_marker, len(gender_to_gender))
-
-    lines_by_scene = LinesByScenes()
-    gender_lines_by_scene = [ lines_by_scene(gender_to_gender, end) for _ ,
-            end in act_scene_start_end ]
-    return gender_lines_by_scene
-
-def bechdel_by_scene(start, end, play_lines, gender_to_gender,
-        forbidden_matcher, play_stats, blacklist_name):
-    # if start == end, this means the scene contains no dialgoue.
-    if start == end:
+    gender_to_gender = { letter : sorted([ line 
+            for speaker in notable[letter]
+            for spoken in notable[letter] - {speaker} 
+            for line in adj[speaker].get(spoken, [])])
+            for letter in notable }
+    # for each scene, the range of gender_to_gender in that scene
+    gender_lines_by_scene = { letter : scene_index.ranges(lines)
+            for letter, lines in gender_to_gender.items() }
+    line_tags = { line_i : tag(play_lines[line_i].dialogue) for line_i in
+            set().union(*gender_to_gender.values()) }
+    bechdel_scenes = { letter : [] for letter in notable }
+    for letter in notable:
+        play_stats[GENDER_PREFIX[letter] + 'blacklist'] = 0
+    for scene in range(len(scene_index)):
+        for letter in notable:
+            start, end = gender_lines_by_scene[letter][scene]
+            bechdel_scenes[letter].append(bechdel_by_scene(
+                gender_to_gender[letter][start:end], letter, play_lines,
+                line_tags, play_stats, GENDER_PREFIX[letter] + 'blacklist'))
+    bechdel = dict()
+    for letter in notable:
+        # Abusing the fact that True is one
+        passes = sum(bechdel_scenes[letter])
+        play_stats[GENDER_PREFIX[letter] + 'passes'] = passes
+        bechdel[letter] = (bechdel_scenes[letter], passes / len(scene_index))
+    return bechdel
+
+def bechdel_by_scene(scene_lines, letter, play_lines, line_tags, play_stats,
+        blacklist_name):
+    # if there are no lines, this means the scene contains no dialgoue.
+    if not scene_lines:
         return False
     notable_gender = set()
     # Test forbidden match and keep track of females in the scene
-    for i in range(start, end):
-        line_i = gender_to_gender[i]
-        line = play_lines[line_i]
+    for line_i in scene_lines:
         # First Test : forbidden match
-        forbidden_match = forbidden_matcher.search(line.dialogue)
-        if forbidden_match:
-            # print("forbidden_match : ", forbidden_match)
+        if letter in line_tags[line_i]:
             play_stats[blacklist_name] += 1
             return False
-        notable_gender.add(line.character)
+        notable_gender.add(play_lines[line_i].character)
     # Return true only if notable females speaking are greater than 1
     return len(notable_gender) > 1
 
-def create_forbidden_matcher(names, letter):
-    """Forbid mention of gender specified by letter"""
+def get_forbidden_words(names, letter):
+    """Words that mention the gender specified by letter, names are the
+    characters of that gender"""
     icky = ['sex', 'sexual', 'intercourse', 'marriage', 'matrimony','courting',
             'wedlock']
     partner = ['partner', 'spouse', 'lover', 'admirer', 'fiancé', 'amour',
@@ -179,8 +203,22 @@ def create_forbidden_matcher(names, letter):
     boyfriend = ['boyfriend', 'husband']
     girlfriend = ['girlfriend', 'wife']
     xfriend = boyfriend if letter == 'M' else girlfriend
-    forbidden_words = icky + partner + xfriend + list(names)
-    return get_matcher(forbidden_words, "forbidden")
+    return icky + partner + xfriend + list(names)
+
+def create_forbidden_tagger(characters, gender, letters):
+    """ Returns tag(dialogue), which gives those of the gender letters whose
+    conversations dialogue is forbidden in, i.e. it mentions one of their
+    OTHER_GENDERS. Dialogue is tokenized once for every gender, splitting
+    possessives so that e.g. "Hamlet's" mentions Hamlet. """
+    word_tags = dict()
+    for letter in letters:
+        for other_letter in OTHER_GENDERS[letter]:
+            names = [ character for character in characters
+                    if gender[character] == other_letter ]
+            for word in get_forbidden_words(names, other_letter):
+                word_tags.setdefault(word, set()).add(letter)
+    return create_phrase_tagger(word_tags,
+            create_tokenizer(PLAIN_WORD_PATTERN))
 
 # VOCAB DIFFERENCES
 
@@ -188,75 +226,15 @@ def vocab_difference(play_lines, gender):
     """ Return a dict that associates each word with whether it is used more
     frequently by males or females, with negative nummbers being female and
     postive numbers being male. Also returns a list that ranks vocab in the
-    play by most female to most male"""
-    males_vocab = dict()
-    female_vocab = dict()
-    line_to_vocab = create_line_to_vocab()
-    for line in play_lines:
-        if line.TYPE == Dialogue.TYPE:
-            gender_character = gender[line.character]
-            if gender_character == "M":
-                line_to_vocab(line.dialogue, males_vocab)
-            elif gender_character == "F":
-                line_to_vocab(line.dialogue, female_vocab)
-    get_word_gender = create_get_word_gender(males_vocab, female_vocab)
-    word_gender = { key : get_word_gender(key)
-            for key in set(males_vocab.keys()).union(set(female_vocab.keys())) }
+    play by most female to most male. See `vocab.VocabIndex.word_gender`"""
+    index = VocabIndex()
+    index.add_play(None, play_lines, gender)
+    word_gender = index.word_gender()
     word_gender_sorted = sorted(word_gender, key=lambda x: word_gender[x])
     # print([ (word, word_gender[word]) for word in word_gender_sorted[:25] ])
     # print([ (word, word_gender[word]) for word in word_gender_sorted[-25:] ])
-    # print(word_gender_sorted[:25])
-    # print(word_gender_sorted[-25:])
     return word_gender, word_gender_sorted
 
-def create_line_to_vocab():
-    remove_punctuation = create_remove_punctuation()
-    def line_to_vocab(line, vocab):
-        stripped = remove_punctuation(line)
-        words = stripped.split(" ")
-        for word in words:
-            if word in vocab:
-                vocab[word] += 1
-            else:
-                vocab[word] = 1
-    return line_to_vocab
-
-def create_get_word_gender(males_vocab, female_vocab):
-    num_male_words = sum(males_vocab.values())
-    num_female_words = sum(female_vocab.values())
-    try:
-        male_threshold = num_male_words / len(males_vocab)
-    except ZeroDivisionError:
-        # The 1 is arbitrary as there are no vocab to test against it.
-        male_threshold = 1
-    try:
-        female_threshold = num_female_words / len(female_vocab)
-    except ZeroDivisionError:
-        # The 1 is arbitrary as there are no vocab to test against it.
-        female_threshold = 1
-    def get_ratio(m_num, f_num):
-        try:
-            norm_m_num = m_num / num_male_words
-        except ZeroDivisionError:
-            norm_m_num  = 0
-        try:
-            norm_f_num = f_num / num_female_words
-        except ZeroDivisionError:
-            norm_f_num = 0
-        diff = norm_m_num - norm_f_num
-        _sum = norm_m_num + norm_f_num
-        ratio = diff / _sum
-        return ratio
-    def get_word_gender(word):
-        """Assign vocab a gender value only if it used more often than the
-        average word"""
-        m_num = males_vocab.get(word, 0)
-        f_num = female_vocab.get(word, 0)
-        meet_threshold = m_num > male_threshold or f_num > female_threshold 
-        metric = get_ratio(m_num, f_num) if meet_threshold else 0
-        return metric
-    return get_word_gender
-
 def get_notable_characters(characters_by_importance, gender, letter):
     characters = [ x[0] for x in characters_by_importance ]
     # if odd number of characters, includes n + 1 characters, where
@@ -267,38 +245,32 @@ def get_notable_characters(characters_by_importance, gender, letter):
     return notable_characters
 
 def postprocess(play_lines, speaking_characters, adj, gender,
-        act_scene_start_end, play_stats):
+        act_scene_start_end, play_stats, metrics_weight=METRICS_WEIGHT):
     adj_num = { speaker : { spoken : len(adj[speaker][spoken]) 
         for spoken in adj[speaker] } 
         for speaker in adj }
     graph = create_graph(adj_num)
-    reciprocal_graph = create_graph(adj_num, reciprocal=True)
-    characters_by_importance = get_characters_by_importance(
-            play_lines, 
-            speaking_characters, 
-            graph,
-            reciprocal_graph,
-            )
-    vocab_difference(play_lines, gender)
-
-    def bechdel_gender(letter):
-        other_letter = 'M' if letter == 'F' else 'F'
-        prefix = 'female ' if letter == 'F' else 'male '
-        notable_gender = get_notable_characters(characters_by_importance,
+    count('graph_nodes', graph.number_of_nodes())
+    count('graph_edges', graph.number_of_edges())
+    with span('get_characters_by_importance'):
+        characters_by_importance = get_characters_by_importance(
+                play_lines, 
+                speaking_characters, 
+                adj_num,
+                metrics_weight,
+                )
+    with span('vocab_difference'):
+        vocab_difference(play_lines, gender)
+    scene_index = SceneIndex(act_scene_start_end)
+
+    notable = dict()
+    for letter in GENDER_PREFIX:
+        notable[letter] = get_notable_characters(characters_by_importance,
                 gender, letter)
-        print(notable_gender)
-        play_stats[prefix + 'notable'] = len(notable_gender)
-        other_gender = filter(lambda x: gender[x] == other_letter,
-                speaking_characters)
-        forbidden_matcher = create_forbidden_matcher(other_gender,
-                other_letter)
-        bechdel_scenes = bechdel_test(play_lines, notable_gender,
-                forbidden_matcher, adj, act_scene_start_end, play_stats, prefix)
-        # print(bechdel_scenes[0].index(True))
-        return bechdel_scenes
-
-    print(bechdel_gender('F'))
-    print(bechdel_gender('M'))
+        play_stats[GENDER_PREFIX[letter] + 'notable'] = len(notable[letter])
+    with span('bechdel_test'):
+        tag = create_forbidden_tagger(speaking_characters, gender, notable)
+        bechdel_test(play_lines, notable, tag, adj, scene_index, play_stats)
     return graph
 
 
@@ -0,0 +1,488 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from utils import file_to_list, json_file_to_dict
+from mit_shakespeare_regex import matcher
+from parse import (get_speaking_characters, parse_raw_text, parse_play,
+        preprocess)
+from trie import get_trie_matcher
+from utils import create_remove_punctuation
+from tokenizer import create_tokenizer, count_words
+from table import PlayTable, iter_dialogue
+from run import parse_and_process, to_output
+from process import (get_act_scene_range, get_entrance_exit, get_presence,
+        process, process_parallel)
+from analysis import (get_characters_by_importance, get_notable_characters,
+        create_forbidden_tagger, bechdel_test, vocab_difference, create_graph,
+        GENDER_PREFIX)
+from scenes import SceneIndex
+from synthetic import generate_play
+
+import numpy as np
+
+# TIMING
+
+def best_of(f, repeat):
+    """ Return the fastest of `repeat` calls to f, in seconds, along with the
+    result of the last call """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def peak_memory(f):
+    """ Peak memory, in bytes, allocated by Python during a call to f, as
+    traced by tracemalloc. Traced separately from timing, as tracing slows
+    allocation down. """
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# PARSING
+
+def cascade(raw_play_lines):
+    speaking_characters = get_speaking_characters(raw_play_lines,
+            matcher.character)
+    play_lines = parse_raw_text(raw_play_lines, speaking_characters, matcher)
+    return speaking_characters, play_lines
+
+def single_pass(raw_play_lines):
+    return parse_play(raw_play_lines, matcher)
+
+def bench_parse(play_paths, repeat=5):
+    """ Compare the five regex cascade with the single pass tokenizer on each
+    play, checking that both parse the play identically.
+
+    Returns
+    -------
+    results : list of tuples
+        (play_name, number of raw lines, cascade time, single pass time)
+    """
+    results = []
+    for play_path in play_paths:
+        play_name = os.path.basename(play_path)[:-len('.html')]
+        raw_play_lines = file_to_list(play_path)
+        cascade_time, expected = best_of(lambda: cascade(raw_play_lines),
+                repeat)
+        single_pass_time, actual = best_of(
+                lambda: single_pass(raw_play_lines), repeat)
+        if expected != actual:
+            raise AssertionError(play_name + " parsed differently")
+        results.append((play_name, len(raw_play_lines), cascade_time,
+            single_pass_time))
+    return results
+
+# NAME MATCHING
+
+def alternation_matcher(words, identifier):
+    """ The matcher that `utils.get_matcher` used to build, a plain
+    alternation of the unescaped words """
+    pattern = "(?P<{0}>".format(identifier) + "|".join(words) + ")"
+    return re.compile(pattern, re.IGNORECASE)
+
+def bench_matcher(play_paths, repeat=3):
+    """ Time `findall` over every stage direction of the given plays, with a
+    matcher for all of their speaking characters combined, so with hundreds
+    of names.
+
+    Returns
+    -------
+    results : list of tuples
+        (number of names, number of stage directions, alternation time, trie
+        time)
+    """
+    names = set()
+    stage_directions = []
+    for play_path in play_paths:
+        for line in file_to_list(play_path):
+            c_match = matcher.character.search(line)
+            if c_match:
+                names.add(c_match.group('name').upper())
+            sd_match = matcher.stage_direction.search(line)
+            if sd_match:
+                stage_directions.append(sd_match.group('stage_direction'))
+    # The alternation would treat regex metacharacters in names as syntax
+    plain_names = sorted(name for name in names if re.escape(name) ==
+            name.replace(' ', '\\ '))
+    results = []
+    for n in [10, 100, len(plain_names)]:
+        subset = plain_names[:n]
+        find_all = lambda m: [ m.findall(x) for x in stage_directions ]
+        alternation_time, _ = best_of(lambda: find_all(
+            alternation_matcher(subset, 'character')), repeat)
+        trie_time, _ = best_of(lambda: find_all(
+            get_trie_matcher(subset, 'character')), repeat)
+        results.append((str(len(subset)), len(stage_directions),
+            alternation_time, trie_time))
+    return results
+
+# CENTRALITY
+
+def get_adj_num(play_path):
+    speaking_characters, play_lines, adj, _ = parse_and_process(
+            file_to_list(play_path))
+    adj_num = { speaker : { spoken : len(adj[speaker][spoken])
+        for spoken in adj[speaker] } for speaker in adj }
+    return speaking_characters, play_lines, adj_num
+
+def bench_centrality(play_paths, repeat=3):
+    """ Compare the networkx and sparse centrality backends of
+    `analysis.get_characters_by_importance` on each play, checking that both
+    rank the characters in the same order.
+
+    Returns
+    -------
+    results : list of tuples
+        (play_name, number of characters, networkx time, sparse time)
+    """
+    results = []
+    for play_path in play_paths:
+        play_name = os.path.basename(play_path)[:-len('.html')]
+        speaking_characters, play_lines, adj_num = get_adj_num(play_path)
+        rank = lambda backend: get_characters_by_importance(play_lines,
+                speaking_characters, adj_num, backend=backend)
+        networkx_time, expected = best_of(lambda: rank('networkx'), repeat)
+        sparse_time, actual = best_of(lambda: rank('sparse'), repeat)
+        if [ x[0] for x in expected ] != [ x[0] for x in actual ]:
+            raise AssertionError(play_name + " ranked differently")
+        results.append((play_name, len(speaking_characters), networkx_time,
+            sparse_time))
+    return results
+
+# TOKENIZING
+
+def translate_and_split(dialogue):
+    """ How `analysis.vocab_difference` used to count words """
+    remove_punctuation = create_remove_punctuation()
+    vocab = dict()
+    for line in dialogue:
+        for word in remove_punctuation(line).split(" "):
+            if word in vocab:
+                vocab[word] += 1
+            else:
+                vocab[word] = 1
+    return vocab
+
+def bench_tokenize(play_paths, repeat=3):
+    """ Time counting the words of all the dialogue of each play, by
+    translating and splitting each line, and with the tokenizer.
+
+    Returns
+    -------
+    results : list of tuples
+        (play_name, number of lines of dialogue, translate and split time,
+        tokenizer time)
+    """
+    tokenize = create_tokenizer()
+    results = []
+    for play_path in play_paths:
+        play_name = os.path.basename(play_path)[:-len('.html')]
+        _, play_lines = single_pass(file_to_list(play_path))
+        dialogue = [ text for _, _, text in iter_dialogue(play_lines) ]
+        split_time, _ = best_of(lambda: translate_and_split(dialogue), repeat)
+        tokenizer_time, _ = best_of(lambda: count_words(dialogue, tokenize),
+                repeat)
+        results.append((play_name, len(dialogue), split_time,
+            tokenizer_time))
+    return results
+
+# STAGES
+
+STAGES = ['preprocess', 'play_table', 'get_entrance_exit', 'get_presence',
+        'get_characters_by_importance', 'bechdel_test', 'vocab_difference',
+        'to_output']
+
+def scale_play(raw_play_lines, factor):
+    """ Synthetic play factor times the size of the given one, by repeating
+    its acts, from the first act line to the last line of dialogue """
+    starts = [ i for i, line in enumerate(raw_play_lines)
+            if matcher.act.search(line) ]
+    ends = [ i for i, line in enumerate(raw_play_lines)
+            if matcher.dialogue.search(line) ]
+    if not starts or not ends:
+        return raw_play_lines
+    start, end = starts[0], ends[-1] + 1
+    return raw_play_lines[:start] + raw_play_lines[start:end] * factor \
+            + raw_play_lines[end:]
+
+def bench_stages_play(raw_play_lines, gender, repeat=3):
+    """ Time and peak memory of each of STAGES on one play, each stage given
+    the output of the ones before, as in `run.process_play`.
+
+    Returns
+    -------
+    measurements : dict
+        maps each stage to (seconds, peak bytes)
+    """
+    measurements = dict()
+    def measure(stage, f):
+        seconds, result = best_of(f, repeat)
+        measurements[stage] = (seconds, peak_memory(f))
+        return result
+
+    speaking_characters, play_lines = measure('preprocess',
+            lambda: preprocess(raw_play_lines, matcher))
+    play_lines = measure('play_table', lambda: PlayTable(play_lines))
+    _, act_scene_range = get_act_scene_range(play_lines)
+    act_scene_start_end = list(zip(act_scene_range, act_scene_range[1:]))
+    entrance, exit = measure('get_entrance_exit',
+            lambda: get_entrance_exit(play_lines, act_scene_start_end))
+    adj = measure('get_presence', lambda: get_presence(speaking_characters,
+        play_lines, act_scene_start_end, entrance, exit))
+    adj_num = { speaker : { spoken : len(adj[speaker][spoken])
+        for spoken in adj[speaker] } for speaker in adj }
+    characters_by_importance = measure('get_characters_by_importance',
+            lambda: get_characters_by_importance(play_lines,
+                speaking_characters, adj_num))
+    notable = { letter : get_notable_characters(characters_by_importance,
+        gender, letter) for letter in GENDER_PREFIX }
+    scene_index = SceneIndex(act_scene_start_end)
+    measure('bechdel_test', lambda: bechdel_test(play_lines, notable,
+        create_forbidden_tagger(speaking_characters, gender, notable), adj,
+        scene_index, dict()))
+    measure('vocab_difference', lambda: vocab_difference(play_lines, gender))
+    graph = create_graph(adj_num)
+    def output():
+        # into a fresh directory each time, so nothing is skipped as
+        # unchanged. Includes rendering only if Graphviz is installed.
+        with tempfile.TemporaryDirectory() as output_path, \
+                contextlib.redirect_stdout(io.StringIO()):
+            to_output((play_lines, graph), output_path,
+                    os.path.join(output_path, 'play'))
+    measure('to_output', output)
+    return measurements
+
+def bench_stages(play_paths, scales=(1,), repeat=3):
+    """ bench_stages_play on each play, scaled up by each of scales, see
+    scale_play. Gender is read from the gender directory next to the plays'
+    directory, and plays without a gender file are skipped.
+
+    Returns
+    -------
+    records : list of dict
+        with keys play, scale, lines, stage, seconds and peak_bytes
+    """
+    records = []
+    for play_path in play_paths:
+        play_name = os.path.basename(play_path)[:-len('.html')]
+        head_dir = os.path.dirname(os.path.dirname(os.path.abspath(
+            play_path)))
+        try:
+            gender = json_file_to_dict(os.path.join(head_dir, 'gender',
+                play_name + '.gender'))
+        except FileNotFoundError:
+            continue
+        raw_play_lines = file_to_list(play_path)
+        for factor in scales:
+            scaled = scale_play(raw_play_lines, factor)
+            measurements = bench_stages_play(scaled, gender, repeat)
+            for stage in STAGES:
+                seconds, peak_bytes = measurements[stage]
+                records.append({'play' : play_name, 'scale' : factor,
+                    'lines' : len(scaled), 'stage' : stage,
+                    'seconds' : seconds, 'peak_bytes' : peak_bytes})
+    return records
+
+def summarize_stages(records):
+    """ (stage, number of runs, total seconds, largest peak in MiB) of each
+    stage """
+    return [ (stage, len(stage_records),
+        sum(record['seconds'] for record in stage_records),
+        max(record['peak_bytes'] for record in stage_records) / 2**20)
+        for stage in STAGES for stage_records in [[ record for record in
+            records if record['stage'] == stage ]] if stage_records ]
+
+# SYNTHETIC
+
+# Parameters of `synthetic.generate_play` for a play about Hamlet's size
+SYNTHETIC_BASE = {'cast_size' : 30, 'scenes' : 20, 'lines_per_scene' : 200,
+        'direction_density' : 0.05, 'crowd_size' : 6}
+
+# The parameter scaled along each axis. Scenes can only scale up to 11 times,
+# see synthetic.MAX_NUMERAL, and the crowd up to the cast size.
+SYNTHETIC_AXES = {'lines' : 'lines_per_scene', 'scenes' : 'scenes',
+        'cast' : 'cast_size', 'crowd' : 'crowd_size'}
+
+def bench_synthetic(axis='lines', scales=(1, 2, 4, 8), repeat=3):
+    """ bench_stages_play on synthetic plays, with the parameter of axis
+    scaled by each of scales from SYNTHETIC_BASE. The plays are parsed by
+    preprocess, as run.py parses them, so the curve of the preprocess stage
+    is that of the parser in use.
+
+    Returns
+    -------
+    records : list of dict
+        as returned by `bench_stages`, with play 'synthetic', and the axis
+    """
+    records = []
+    for factor in scales:
+        parameters = dict(SYNTHETIC_BASE)
+        parameters[SYNTHETIC_AXES[axis]] *= factor
+        raw_play_lines, gender = generate_play(**parameters)
+        measurements = bench_stages_play(raw_play_lines, gender, repeat)
+        for stage in STAGES:
+            seconds, peak_bytes = measurements[stage]
+            records.append({'play' : 'synthetic', 'axis' : axis,
+                'scale' : factor, 'lines' : len(raw_play_lines),
+                'stage' : stage, 'seconds' : seconds,
+                'peak_bytes' : peak_bytes})
+    return records
+
+def summarize_curves(records, scales):
+    """ (stage, slope, seconds at each scale) of each stage, where slope is
+    that of log seconds against log scale, so 1 is linear and 2 quadratic
+    """
+    rows = []
+    for stage in STAGES:
+        seconds = [ record['seconds'] for record in records
+                if record['stage'] == stage ]
+        slope = np.polyfit(np.log(scales), np.log(seconds), 1)[0] \
+                if len(set(scales)) > 1 else float('nan')
+        rows.append((stage, "{:.2f}".format(slope), *seconds))
+    return rows
+
+# SCENE PARALLELISM
+
+# at least two, so that the scenes are processed in parallel even on one cpu
+SCENE_JOBS = max(2, os.cpu_count() or 1)
+
+def bench_scenes(play_paths, repeat=3, factor=4):
+    """ Compare processing the scenes of each play, scaled up factor times,
+    serially and over a pool of SCENE_JOBS processes, checking both give the
+    same adj. The pool is used however short the play and however few cpus
+    there are, unlike in `process.process`, to show where it pays off.
+
+    Returns
+    -------
+    results : list of tuples
+        (play_name, number of lines, serial time, parallel time)
+    """
+    results = []
+    for play_path in play_paths:
+        play_name = os.path.basename(play_path)[:-len('.html')]
+        speaking_characters, play_lines = preprocess(
+                scale_play(file_to_list(play_path), factor), matcher)
+        play_lines = PlayTable(play_lines)
+        serial_time, expected = best_of(lambda: process(speaking_characters,
+            play_lines), repeat)
+        _, act_scene_range = get_act_scene_range(play_lines)
+        act_scene_start_end = list(zip(act_scene_range, act_scene_range[1:]))
+        parallel_time, (_, _, adj) = best_of(lambda: process_parallel(
+            speaking_characters, play_lines, act_scene_start_end,
+            SCENE_JOBS), repeat)
+        if expected != (adj, act_scene_start_end):
+            raise AssertionError(play_name + " processed differently")
+        results.append((play_name, len(play_lines), serial_time,
+            parallel_time))
+    return results
+
+# RESULTS
+
+def get_commit():
+    """ Commit of the working tree, None outside of git """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def to_records(results, headers):
+    return [ dict(zip(headers, result)) for result in results ]
+
+def print_results(results, headers, totals=True):
+    width = max([20] + [ len(str(result[0])) + 2 for result in results ])
+    row_format = "{:<" + str(width) + "}{:>12}" + "{:>17}" * (len(headers) - 2)
+    print(row_format.format(*headers))
+    for name, n, *times in results:
+        print(row_format.format(name, n, *[ "{:.4f}".format(t) for t in
+            times ]))
+    if not totals:
+        return
+    totals = [ sum(column) for column in list(zip(*results))[2:] ]
+    print(row_format.format('total', sum(x[1] for x in results),
+        *[ "{:.4f}".format(t) for t in totals ]))
+
+SUITES = {
+    'parse' : (bench_parse,
+        ['play', 'lines', 'cascade (s)', 'single (s)']),
+    'matcher' : (bench_matcher,
+        ['names', 'directions', 'alternation (s)', 'trie (s)']),
+    'centrality' : (bench_centrality,
+        ['play', 'characters', 'networkx (s)', 'sparse (s)']),
+    'tokenize' : (bench_tokenize,
+        ['play', 'dialogue', 'split (s)', 'tokenizer (s)']),
+    'scenes' : (bench_scenes,
+        ['play', 'lines', 'serial (s)', 'parallel (s)']),
+    }
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline")
+    parser.add_argument('plays', nargs='?', default="plays/**/*.html",
+            help="glob of the plays to benchmark")
+    parser.add_argument('--suites', nargs='+',
+            default=list(SUITES) + ['stages'],
+            choices=list(SUITES) + ['stages', 'synthetic'])
+    parser.add_argument('--scales', nargs='+', type=int, default=None,
+            help="scale the plays up this many times, e.g. 1 10 100. "
+            "Defaults to 1 for the stages suite, and to 1 2 4 8 for the "
+            "synthetic suite")
+    parser.add_argument('--axis', choices=list(SYNTHETIC_AXES),
+            default='lines',
+            help="parameter of the synthetic plays to scale")
+    parser.add_argument('--repeat', type=int, default=3,
+            help="time each stage as the best of this many runs")
+    parser.add_argument('--json', default=None,
+            help="write every result to this json file, to compare between "
+            "commits")
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    play_paths = sorted(glob.glob(args.plays, recursive=True))
+    output = {
+        'commit' : get_commit(),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'suites' : dict(),
+        }
+    for suite in args.suites:
+        if suite == 'stages':
+            records = bench_stages(play_paths, args.scales or [1],
+                    args.repeat)
+            print_results(summarize_stages(records), ['stage', 'runs',
+                'total (s)', 'peak (MiB)'], totals=False)
+        elif suite == 'synthetic':
+            scales = args.scales or [1, 2, 4, 8]
+            records = bench_synthetic(args.axis, scales, args.repeat)
+            print_results(summarize_curves(records, scales),
+                    ['stage', 'slope'] + [ "x{0} (s)".format(factor)
+                        for factor in scales ], totals=False)
+        else:
+            bench, headers = SUITES[suite]
+            results = bench(play_paths)
+            print_results(results, headers)
+            records = to_records(results, headers)
+        output['suites'][suite] = records
+        print()
+    if args.json:
+        with open(args.json, 'w') as jsonFile:
+            json.dump(output, jsonFile, indent=4)
+
+
+if __name__ == "__main__":
+    main()
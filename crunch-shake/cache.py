@@ -0,0 +1,90 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+"""
+STAGE CACHE
+===========
+
+On disk store of the outputs of pipeline stages, see pipeline.py, so that
+rerunning the analysis on an unchanged play skips the stages whose inputs
+have not changed.
+
+Entries are pickled, under a key worked out by `pipeline.Pipeline.get_key`,
+which includes `get_source_hash` of the modules a stage depends on, so
+editing any of them invalidates its entries. PARSER_MODULES and
+PARSER_VERSION are those of parsing and processing a play. The cache is kept
+under a maximum size by evicting the least recently used entries.
+"""
+
+PARSER_VERSION = 1
+
+PARSER_MODULES = ['parse', 'process', 'lines', 'utils', 'trie',
+        'mit_shakespeare_regex', 'lookup']
+
+MAX_CACHE_SIZE = 256 * 2**20
+
+SUFFIX = '.pickle'
+
+def get_source_hash(modules, version=0):
+    """ Hash of version and the source of modules, which are names of the
+    modules next to this one """
+    digest = hashlib.sha256(str(version).encode())
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        with open(os.path.join(source_dir, module + '.py'), 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+def load(cache_dir, key):
+    """ Return the cached value, or None if there is no (readable) entry """
+    path = os.path.join(cache_dir, key + SUFFIX)
+    try:
+        with open(path, 'rb') as entry:
+            value = pickle.load(entry)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError):
+        return None
+    # mark as recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+def store(cache_dir, key, value, max_size=MAX_CACHE_SIZE):
+    """ Atomically write value to the cache and then evict entries until the
+    cache is no bigger than max_size bytes """
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as entry:
+            pickle.dump(value, entry, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, os.path.join(cache_dir, key + SUFFIX))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    evict(cache_dir, max_size)
+
+def evict(cache_dir, max_size=MAX_CACHE_SIZE):
+    """ Remove the least recently used entries until the total size of the
+    cache is at most max_size bytes """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(SUFFIX):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,189 @@
+import time
+START = time.perf_counter()
+
+import argparse
+import json
+import os
+import sys
+
+from render import ENGINES, FORMATS
+
+"""
+COMMAND LINE
+============
+
+`python cli.py <command> PLAYS...` with the commands
+
+    parse    parse plays, and optionally write them as play files
+    stats    count the speaking characters of each gender
+    graph    who speaks to whom, as the number of lines
+    render   draw the graph of each play, see render.py
+    bechdel  every stat, including the Bechdel test, as `run.py` does
+
+Each command imports only the modules it needs, as numpy, scipy and
+networkx take most of the start up time, which matters when the tool is
+invoked once per play from a script. parse and stats import none of them,
+graph only numpy. Pass --import-time to see the time taken to start up, and
+which of them were imported.
+"""
+
+HEAVY_MODULES = ['numpy', 'scipy', 'networkx', 'pygraphviz']
+
+def report_import_time(args):
+    """ Print the time since start up, and the heavy modules imported, to
+    stderr, if asked to. Called by each command once it has imported what it
+    needs. """
+    if not args.import_time:
+        return
+    imported = [ module for module in HEAVY_MODULES if module in sys.modules ]
+    print("import time: {0:.3f}s, imported: {1}".format(
+        time.perf_counter() - START, ", ".join(imported) or "none"),
+        file=sys.stderr)
+
+def print_json(x):
+    print(json.dumps(x, indent=4))
+
+# COMMANDS
+
+def parse_command(args):
+    from run import expand_play_paths, get_paths, PLAY_SUFFIX
+    from utils import file_to_list
+    from mit_shakespeare_regex import matcher
+    from parse import preprocess
+    if args.write:
+        from playfile import write_play
+    report_import_time(args)
+    summary = dict()
+    for play_path in expand_play_paths(args.plays):
+        _, output_path, output_path_base, play_name, _ = get_paths(play_path)
+        speaking_characters, play_lines = preprocess(file_to_list(play_path),
+                matcher)
+        summary[play_name] = {'lines' : len(play_lines),
+                'characters' : len(speaking_characters)}
+        if args.write:
+            os.makedirs(output_path, exist_ok=True)
+            write_play(output_path_base + PLAY_SUFFIX, play_lines,
+                    play=play_name)
+    print_json(summary)
+
+def stats_command(args):
+    from run import expand_play_paths, get_paths, get_files, gender_stats
+    from utils import get_title
+    from mit_shakespeare_regex import matcher
+    from parse import get_speaking_characters
+    report_import_time(args)
+    stats = dict()
+    for play_path in expand_play_paths(args.plays):
+        gender_path, _, _, play_name, _ = get_paths(play_path)
+        raw_play_lines, gender = get_files(play_path, gender_path)
+        play_stats = stats[play_name] = {'title' : get_title(raw_play_lines)}
+        speaking_characters = get_speaking_characters(raw_play_lines,
+                matcher.character)
+        play_stats['characters'] = len(speaking_characters)
+        if gender is not None:
+            gender_stats(speaking_characters, gender, play_stats)
+    print_json(stats)
+
+def graph_command(args):
+    from run import expand_play_paths, get_paths, create_play_pipeline
+    from utils import file_to_list
+    # imported up front, rather than by run.parse_and_process, so that it
+    # counts towards the import time
+    import process
+    report_import_time(args)
+    graphs = dict()
+    for play_path in expand_play_paths(args.plays):
+        _, _, _, play_name, cache_path = get_paths(play_path)
+        pipeline = create_play_pipeline(cache_path if args.use_cache
+                else None, args.scene_jobs)
+        _, _, adj, _ = pipeline.run({'html' : file_to_list(play_path)},
+                ['parse_and_process'])['parse_and_process']
+        graphs[play_name] = { speaker : { spoken : len(adj[speaker][spoken])
+            for spoken in adj[speaker] } for speaker in adj }
+    print_json(graphs)
+
+def render_command(args):
+    from run import expand_play_paths, run_corpus
+    from render import render_graphs
+    # imported up front, rather than by the pipeline, so that they count
+    # towards the import time
+    import process, analysis
+    report_import_time(args)
+    _, graphs = run_corpus(expand_play_paths(args.plays), args.jobs,
+            args.use_cache)
+    for output_path_base in graphs:
+        os.makedirs(os.path.dirname(output_path_base), exist_ok=True)
+    statuses = render_graphs(graphs, args.engines, args.formats, args.jobs,
+            args.timeout, args.force_render)
+    for output_file in sorted(statuses):
+        print(output_file, statuses[output_file])
+
+def bechdel_command(args):
+    from run import expand_play_paths, run_corpus
+    # as in render_command
+    import process, analysis
+    report_import_time(args)
+    stats, _ = run_corpus(expand_play_paths(args.plays), args.jobs,
+            args.use_cache)
+    print_json(stats)
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Analyse plays")
+    parser.add_argument('--import-time', action='store_true',
+            help="print the start up time, and the heavy modules imported, "
+            "to stderr")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, function, help):
+        command = commands.add_parser(name, help=help)
+        command.set_defaults(function=function)
+        command.add_argument('plays', nargs='+',
+                help="play html files, directories of them, or globs such "
+                "as 'plays/*.html'")
+        return command
+
+    def add_corpus_arguments(command):
+        command.add_argument('-j', '--jobs', type=int, default=None,
+                help="number of worker processes, defaults to the number of "
+                "cpus")
+        command.add_argument('--no-cache', dest='use_cache',
+                action='store_false',
+                help="always parse the plays, instead of loading them from "
+                "the cache of parsed plays")
+
+    parse = add_command('parse', parse_command,
+            "parse plays, printing the number of lines and characters")
+    parse.add_argument('--write', action='store_true',
+            help="write each parsed play to the output directory as a play "
+            "file, see playfile.py")
+    add_command('stats', stats_command,
+            "count the speaking characters of each gender")
+    graph = add_command('graph', graph_command,
+            "print the number of lines each character speaks to each other")
+    graph.add_argument('--no-cache', dest='use_cache', action='store_false')
+    graph.add_argument('--scene-jobs', type=int, default=None,
+            help="number of worker processes to process the scenes of each "
+            "play with, for very long plays")
+    render = add_command('render', render_command,
+            "draw the graph of each play into the output directory")
+    add_corpus_arguments(render)
+    render.add_argument('--engines', nargs='+', default=list(ENGINES),
+            help="Graphviz layout engines to render with")
+    render.add_argument('--formats', nargs='+', default=['png'],
+            help="Graphviz output formats, e.g. " + " ".join(FORMATS))
+    render.add_argument('--timeout', type=float, default=60,
+            help="seconds after which a single layout is abandoned")
+    render.add_argument('--force-render', action='store_true',
+            help="render even unchanged graphs")
+    bechdel = add_command('bechdel', bechdel_command,
+            "print every stat of each play, including the Bechdel test")
+    add_corpus_arguments(bechdel)
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import flatten_stats
+from table import iter_rows
+
+"""
+COLUMNAR EXPORT
+===============
+
+Writes every parsed play as Parquet, for dataframe tools such as pandas and
+polars to scan the corpus lazily, in three tables
+
+    lines  play, idx, type, character, act, scene, text
+           a row per line of play_lines, see `table.iter_rows`
+    edges  play, speaker, listener, lines
+           the number of lines each character speaks to each other, the
+           weights of the graph of `analysis.postprocess` (its adj_num)
+    stats  play, name, value
+           play_stats, with timings and counters named e.g.
+           'timings.postprocess'
+
+Each table is a directory holding a file per play, e.g.
+parquet/lines/hamlet.parquet, so plays are appended (or replaced) one at a
+time as `run.run` processes them, from any number of processes, without
+rewriting the rest. A directory reads as a single table, e.g.
+`pandas.read_parquet('parquet/lines')` or
+`polars.scan_parquet('parquet/lines/*.parquet')`.
+
+The play, type, character and stat name columns are dictionary encoded, as
+they repeat on almost every row.
+
+Requires pyarrow, which is only imported by `run.py` when exporting.
+"""
+
+STRING = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMAS = {
+    'lines' : pa.schema([
+        ('play', STRING),
+        ('idx', pa.int32()),
+        ('type', STRING),
+        ('character', STRING),
+        ('act', pa.int16()),
+        ('scene', pa.int16()),
+        ('text', pa.string()),
+        ]),
+    'edges' : pa.schema([
+        ('play', STRING),
+        ('speaker', STRING),
+        ('listener', STRING),
+        ('lines', pa.int32()),
+        ]),
+    'stats' : pa.schema([
+        ('play', STRING),
+        ('name', STRING),
+        ('value', pa.float64()),
+        ]),
+    }
+
+PARQUET_SUFFIX = '.parquet'
+
+def to_table(name, columns):
+    """ Table name of SCHEMAS from a dict of lists, one per column """
+    return pa.Table.from_pydict(columns, schema=SCHEMAS[name])
+
+def get_tables(play_name, play_lines, graph, play_stats):
+    """ Tables of a play, keyed by name. graph is as returned by
+    `analysis.postprocess`, weighted by the number of lines. """
+    rows = list(iter_rows(play_lines))
+    idx, types, characters, acts, scenes, texts = (list(column) for column
+            in zip(*rows)) if rows else ([],) * 6
+    edges = sorted(graph.edges(data='weight'))
+    stats = list(flatten_stats(play_stats))
+    return {
+        'lines' : to_table('lines', {'play' : [play_name] * len(rows),
+            'idx' : idx, 'type' : types, 'character' : characters,
+            'act' : acts, 'scene' : scenes, 'text' : texts}),
+        'edges' : to_table('edges', {'play' : [play_name] * len(edges),
+            'speaker' : [ speaker for speaker, _, _ in edges ],
+            'listener' : [ listener for _, listener, _ in edges ],
+            'lines' : [ weight for _, _, weight in edges ]}),
+        'stats' : to_table('stats', {'play' : [play_name] * len(stats),
+            'name' : [ name for name, _ in stats ],
+            'value' : [ float(value) for _, value in stats ]}),
+        }
+
+def write_play_tables(parquet_dir, play_name, play_lines, graph,
+        play_stats):
+    """ Write the tables of a play into parquet_dir, replacing those it
+    had. Each file is written to a temporary file first and renamed, so
+    readers never see one half written. """
+    for name, table in get_tables(play_name, play_lines, graph,
+            play_stats).items():
+        table_dir = os.path.join(parquet_dir, name)
+        os.makedirs(table_dir, exist_ok=True)
+        path = os.path.join(table_dir, play_name + PARQUET_SUFFIX)
+        # hidden, so that it is skipped when reading the directory
+        temp_path = os.path.join(table_dir, '.' + play_name + '.tmp')
+        pq.write_table(table, temp_path, compression='zstd')
+        os.replace(temp_path, path)
+
+def read_table(parquet_dir, name):
+    """ Table name of every play in parquet_dir, as one pyarrow Table """
+    return pq.read_table(os.path.join(parquet_dir, name),
+            schema=SCHEMAS[name])
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description="Summarise a Parquet export, see run.py --parquet")
+    parser.add_argument('parquet_dir')
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    for name in SCHEMAS:
+        table = read_table(args.parquet_dir, name)
+        print("{0}: {1} rows, {2} plays".format(name, table.num_rows,
+            len(table.column('play').unique())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import os
+import sqlite3
+
+from utils import get_title, flatten_stats
+from table import iter_rows
+from run import (expand_play_paths, get_paths, get_files,
+        create_play_pipeline, run_play_pipeline)
+
+"""
+DATABASE EXPORT
+===============
+
+Loads parsed plays into a normalized SQLite database, so that the corpus can
+be queried in SQL (see query.py) without running the pipeline again.
+
+    plays       play_id, name, title
+    characters  character_id, play_id, name, gender
+    scenes      play_id, scene_i, act, scene, start_line, end_line
+                scene_i is the index of the scene in act_scene_start_end,
+                start_line and end_line the range of its lines
+    lines       play_id, line_i, type, character_id, act, scene, text
+                line_i is the index of the line in play_lines, character_id
+                the speaker (the default character for instructions), and
+                text the dialogue or the raw instruction
+    edges       play_id, speaker_id, listener_id, line_i
+                a row for each line in adj[speaker][listener]
+    stats       play_id, name, value
+                play_stats, with timings and counters named e.g.
+                'timings.postprocess'
+
+A play exported again replaces its previous rows. Rows are inserted with
+executemany, all in a single transaction, which is what makes loading the
+corpus quick: SQLite syncs to disk once, rather than once per row.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    play_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS characters (
+    character_id INTEGER PRIMARY KEY,
+    play_id INTEGER NOT NULL REFERENCES plays(play_id),
+    name TEXT NOT NULL,
+    gender TEXT,
+    UNIQUE (play_id, name)
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    play_id INTEGER NOT NULL REFERENCES plays(play_id),
+    scene_i INTEGER NOT NULL,
+    act INTEGER,
+    scene INTEGER,
+    start_line INTEGER NOT NULL,
+    end_line INTEGER NOT NULL,
+    PRIMARY KEY (play_id, scene_i)
+);
+CREATE TABLE IF NOT EXISTS lines (
+    play_id INTEGER NOT NULL REFERENCES plays(play_id),
+    line_i INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    character_id INTEGER REFERENCES characters(character_id),
+    act INTEGER,
+    scene INTEGER,
+    text TEXT,
+    PRIMARY KEY (play_id, line_i)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    play_id INTEGER NOT NULL REFERENCES plays(play_id),
+    speaker_id INTEGER NOT NULL REFERENCES characters(character_id),
+    listener_id INTEGER NOT NULL REFERENCES characters(character_id),
+    line_i INTEGER NOT NULL,
+    PRIMARY KEY (play_id, speaker_id, listener_id, line_i)
+);
+CREATE TABLE IF NOT EXISTS stats (
+    play_id INTEGER NOT NULL REFERENCES plays(play_id),
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (play_id, name)
+);
+CREATE INDEX IF NOT EXISTS lines_character ON lines (character_id);
+CREATE INDEX IF NOT EXISTS edges_speaker ON edges (speaker_id);
+CREATE INDEX IF NOT EXISTS edges_listener ON edges (listener_id);
+CREATE INDEX IF NOT EXISTS characters_gender ON characters (gender);
+CREATE INDEX IF NOT EXISTS stats_name ON stats (name);
+"""
+
+# tables holding rows of a play, in the order they are deleted
+PLAY_TABLES = ['edges', 'lines', 'scenes', 'stats', 'characters']
+
+def connect(path):
+    """ Connection to the database at path, created if need be """
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+def export_play(connection, play_name, title, parsed_play, gender,
+        play_stats):
+    """ Insert the rows of a play, replacing any it already has. Does not
+    commit, see `export_corpus`.
+
+    Parameters
+    ----------
+    parsed_play : tuple
+        (speaking_characters, play_lines, adj, act_scene_start_end), as
+        given by `run.parse_and_process`
+    gender : dict
+        None if the play has no gender file
+    play_stats : dict
+        None to leave out the play's stats
+    """
+    speaking_characters, play_lines, adj, act_scene_start_end = parsed_play
+    gender = gender or dict()
+    row = connection.execute("SELECT play_id FROM plays WHERE name = ?",
+            (play_name,)).fetchone()
+    if row is not None:
+        play_id = row[0]
+        for table in PLAY_TABLES:
+            connection.execute("DELETE FROM {0} WHERE play_id = ?".format(
+                table), (play_id,))
+        connection.execute("UPDATE plays SET title = ? WHERE play_id = ?",
+                (title, play_id))
+    else:
+        play_id = connection.execute(
+                "INSERT INTO plays (name, title) VALUES (?, ?)",
+                (play_name, title)).lastrowid
+
+    line_rows = list(iter_rows(play_lines))
+    names = list(speaking_characters)
+    names.extend(row[2] for row in line_rows if row[2] is not None)
+    for speaker in adj:
+        names.append(speaker)
+        names.extend(adj[speaker])
+
+    connection.executemany(
+            "INSERT INTO characters (play_id, name, gender) VALUES (?, ?, ?)",
+            ((play_id, name, gender.get(name)) for name in
+                dict.fromkeys(names)))
+    character_id = dict(connection.execute(
+        "SELECT name, character_id FROM characters WHERE play_id = ?",
+        (play_id,)))
+    connection.executemany(
+            "INSERT INTO lines (play_id, line_i, type, character_id, act, "
+            "scene, text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((play_id, line_i, line_type, character_id.get(character), act,
+                scene, text) for line_i, line_type, character, act, scene,
+                text in line_rows))
+    connection.executemany(
+            "INSERT INTO scenes (play_id, scene_i, act, scene, start_line, "
+            "end_line) VALUES (?, ?, ?, ?, ?, ?)",
+            ((play_id, scene_i, line_rows[end - 1][3], line_rows[end - 1][4],
+                start, end) for scene_i, (start, end) in
+                enumerate(act_scene_start_end)))
+    connection.executemany(
+            "INSERT INTO edges (play_id, speaker_id, listener_id, line_i) "
+            "VALUES (?, ?, ?, ?)",
+            ((play_id, character_id[speaker], character_id[listener], line_i)
+                for speaker in adj for listener in adj[speaker]
+                for line_i in adj[speaker][listener]))
+    if play_stats is not None:
+        connection.executemany(
+                "INSERT INTO stats (play_id, name, value) VALUES (?, ?, ?)",
+                ((play_id, name, value) for name, value in
+                    flatten_stats(play_stats)))
+
+def export_corpus(play_paths, database_path, stats=None, use_cache=True):
+    """ Export every play in play_paths to the database at database_path, in
+    a single transaction.
+
+    The plays are run through their pipeline (see `run.create_play_pipeline`)
+    so with use_cache, plays already run are loaded from the cache. If stats
+    (as given by `run.run_corpus`) has a play's stats, only its parsing is
+    needed. Plays without a gender file are exported without stats.
+    """
+    connection = connect(database_path)
+    try:
+        with connection:
+            for play_path in play_paths:
+                gender_path, _, _, play_name, cache_path = get_paths(
+                        play_path)
+                cache_path = cache_path if use_cache else None
+                raw_play_lines, gender = get_files(play_path, gender_path)
+                title = get_title(raw_play_lines)
+                if gender is None or (stats and play_name in stats):
+                    play_stats = (stats or dict()).get(play_name)
+                    parsed_play = create_play_pipeline(cache_path).run(
+                            {'html' : raw_play_lines}, ['parse_and_process']
+                            )['parse_and_process']
+                else:
+                    play_stats = {'title' : title}
+                    parsed_play = run_play_pipeline(raw_play_lines, gender,
+                            play_stats, cache_path)['parse_and_process']
+                export_play(connection, play_name, title, parsed_play,
+                        gender, play_stats)
+    finally:
+        connection.close()
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description="Export plays to an SQLite database")
+    parser.add_argument('plays', nargs='+',
+            help="play html files, directories of them, or globs such as "
+            "'plays/*.html'")
+    parser.add_argument('--database', default='plays.sqlite')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+            help="always parse the plays, instead of loading them from the "
+            "cache of parsed plays")
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    export_corpus(expand_play_paths(args.plays), args.database,
+            use_cache=args.use_cache)
+    print("exported to", os.path.abspath(args.database))
+
+
+if __name__ == "__main__":
+    main()
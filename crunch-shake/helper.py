@@ -1,12 +1,18 @@
 import sys
 import os
-from urllib.request import urlopen
 import glob
+import hashlib
+import json
 import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
 
 from parse import get_speaking_characters
 from mit_shakespeare_regex import matcher
-from utils import file_to_list, to_json, str_to_file
+from utils import file_to_list, to_json, json_file_to_dict
 
 
 def blank_gender_files():
@@ -20,14 +26,143 @@ def blank_gender_files():
         to_json(speaking_characters_dict, json_name)
         print(json_name)
 
+# DOWNLOADING
+
+BASE_URL = "http://shakespeare.mit.edu/"
+
+# Records, for each downloaded play, its ETag, Last-Modified and the sha256 of
+# what was written, so that later downloads can be conditional and plays
+# edited since (see plays/differences.txt) are not overwritten.
+DOWNLOAD_RECORD = ".download.json"
+
+# read once here, as os.umask can only be read by setting it, which is not
+# safe once downloads run in threads
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 def get_html(names):
     li_names = names.strip().split("\n")
     print(li_names)
-    for name in li_names[-3:-2]:
-        url = "http://shakespeare.mit.edu/" + name + "/full.html"
-        print(url)
-        html = urlopen(url).read().decode('utf-8')
-        str_to_file(html, "plays/" + name + ".html")
+    statuses = download_plays(li_names)
+    for name in li_names:
+        print(name, statuses[name])
+
+def download_plays(names, plays_dir="plays", base_url=BASE_URL, jobs=8,
+        retries=3, timeout=30, overwrite=False):
+    """ Download the full html of each play into plays_dir, jobs at a time.
+
+    Requests are conditional on the ETag and Last-Modified of the last
+    download, so only plays that have changed are downloaded again. Each play
+    is written atomically.
+
+    Parameters
+    ----------
+    names : list of str
+        names of the plays on the site, e.g. 'hamlet'
+    retries : int
+        number of times to retry a request that fails with a network error or
+        a server error
+    overwrite : bool
+        overwrite plays which have been edited since they were downloaded (or
+        which were not downloaded by this function, such as those in the
+        repository, many edited by hand). By default they are kept.
+
+    Returns
+    -------
+    statuses : dict
+        maps each name to 'downloaded', 'unchanged', 'kept' (changed on the
+        site but edited locally) or 'failed: <reason>'
+    """
+    record_path = os.path.join(plays_dir, DOWNLOAD_RECORD)
+    try:
+        record = json_file_to_dict(record_path)
+    except FileNotFoundError:
+        record = dict()
+    os.makedirs(plays_dir, exist_ok=True)
+
+    def download(name):
+        play_path = os.path.join(plays_dir, name + ".html")
+        play_record = record.get(name, dict())
+        if os.path.exists(play_path):
+            # a play with no record was not downloaded here, so may have been
+            # edited, and is kept unless overwriting
+            with open(play_path, 'rb') as play:
+                edited = file_hash(play.read()) != play_record.get('sha256')
+        else:
+            edited = False
+            play_record = dict()
+        try:
+            status, body, headers = fetch(base_url + name + "/full.html",
+                    play_record.get('etag'), play_record.get('last_modified'),
+                    retries, timeout)
+        except (HTTPError, URLError, OSError) as error:
+            return name, 'failed: ' + str(error), None
+        if status == 304:
+            return name, 'unchanged', None
+        if edited and not overwrite:
+            return name, 'kept', None
+        atomic_write(play_path, body)
+        return name, 'downloaded', {
+                'etag' : headers.get('ETag'),
+                'last_modified' : headers.get('Last-Modified'),
+                'sha256' : file_hash(body),
+                }
+
+    statuses = dict()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for name, status, play_record in executor.map(download, names):
+            statuses[name] = status
+            if play_record:
+                record[name] = play_record
+    atomic_write(record_path, json.dumps(record, indent=4).encode('utf-8'))
+    return statuses
+
+def fetch(url, etag=None, last_modified=None, retries=3, timeout=30):
+    """ GET url, conditionally if etag or last_modified are given, retrying
+    with exponential backoff on network and server errors.
+
+    Returns
+    -------
+    (status, body, headers)
+        status is 304, with an empty body, if the page has not been modified
+    """
+    headers = dict()
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    for attempt in range(retries + 1):
+        try:
+            with urlopen(Request(url, headers=headers),
+                    timeout=timeout) as response:
+                return response.status, response.read(), response.headers
+        except HTTPError as error:
+            if error.code == 304:
+                return 304, b'', error.headers
+            if error.code < 500 or attempt == retries:
+                raise
+        except OSError:
+            # URLError, and timeouts or resets while reading the response
+            if attempt == retries:
+                raise
+        time.sleep(0.5 * 2 ** attempt)
+
+def atomic_write(path, data):
+    """ Write bytes to path, such that path is never left half written """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+            suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as outputFile:
+            outputFile.write(data)
+        # mkstemp only allows the owner to read, make it as open would
+        os.chmod(temp_path, 0o666 & ~UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
 
 def main():
     # get_html(names)
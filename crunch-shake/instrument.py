@@ -0,0 +1,107 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+"""
+INSTRUMENTATION
+===============
+
+Timing spans and counters for the stages of the pipeline.
+
+Stages mark themselves with `span` and `count`, which do nothing unless a
+Recorder is active, e.g.
+
+>>> with recording() as recorder:
+...     with span('parse'):
+...         count('lines', len(play_lines))
+>>> recorder.report()
+{'timings': {'parse': 0.012}, 'counters': {'lines': 5392}}
+
+`run.process_play` records every play, and attaches the report to its
+play_stats. Reports can also be passed to a sink, one of SINKS, such as a
+log or a json lines file.
+"""
+
+logger = logging.getLogger(__name__)
+
+class Recorder:
+    """ Attributes
+    ----------
+    timings : dict
+        maps each span to the total seconds spent in it. Nested spans are
+        named by their path, e.g. 'postprocess/bechdel_test'
+    counters : Counter
+    """
+    def __init__(self):
+        self.timings = dict()
+        self.counters = Counter()
+        self._stack = []
+
+    @contextmanager
+    def span(self, name):
+        self._stack.append(name)
+        path = '/'.join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[path] = self.timings.get(path, 0) \
+                    + time.perf_counter() - start
+            self._stack.pop()
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def report(self):
+        return {'timings' : dict(self.timings),
+                'counters' : dict(self.counters)}
+
+_recorder = None
+
+@contextmanager
+def recording():
+    """ Make a new Recorder the active one, for the duration of the context
+    """
+    global _recorder
+    previous = _recorder
+    _recorder = Recorder()
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
+
+def span(name):
+    """ Context manager timing its body under name, if recording """
+    if _recorder is None:
+        return nullcontext()
+    return _recorder.span(name)
+
+def count(name, n=1):
+    """ Add n to the counter name, if recording """
+    if _recorder is not None:
+        _recorder.count(name, n)
+
+# SINKS
+# Each is called with the name of a play and its report
+
+def null_sink(play_name, report):
+    pass
+
+def log_sink(play_name, report):
+    logger.info("%s %s", play_name, json.dumps(report))
+
+def create_json_sink(path):
+    """ Sink appending each report to path as a line of json """
+    def json_sink(play_name, report):
+        with open(path, 'a') as outputFile:
+            outputFile.write(json.dumps({'play' : play_name, **report})
+                    + "\n")
+    return json_sink
+
+SINKS = {
+    'none' : lambda path: null_sink,
+    'log' : lambda path: log_sink,
+    'json' : create_json_sink,
+    }
@@ -1,4 +1,29 @@
 from collections import namedtuple
+from enum import IntEnum
+
+class Action(IntEnum):
+    """ Kind of action in a stage direction, as matched by the instruction
+    matcher. NONE if no action was matched. """
+    NONE = 0
+    ENTER = 1
+    RE_ENTER = 2
+    EXIT = 3
+    EXEUNT = 4
+    ASIDE = 5
+    READ = 6
+    TO = 7
+
+    @classmethod
+    def classify(cls, action):
+        """ Action of the matched action string, e.g. 'Exeunt' gives
+        Action.EXEUNT """
+        if not action:
+            return cls.NONE
+        return cls.__members__.get(action.upper().replace('-', '_'),
+                cls.NONE)
+
+ENTERING = frozenset([Action.ENTER, Action.RE_ENTER])
+EXITING = frozenset([Action.EXIT, Action.EXEUNT])
 
 class Dialogue(namedtuple('Dialogue', [
         'dialogue', 
@@ -43,7 +68,8 @@ class Instruction(namedtuple('Instruction', [
     'raw', 
     'actions', 
     'characters',
-    'default_character'
+    'default_character',
+    'events'
     ])):
     """ Stage direction, could be embedded in line of dialogue
 
@@ -62,6 +88,9 @@ class Instruction(namedtuple('Instruction', [
         If name is embedded in dialogue, default_character is the person who
         spoke the line. Else it is the person who spoke the previous line. If
         it is that start of the scene, then None.
+    events : list of Action
+        The actions, classified (once, when parsed) so that they can be
+        compared without string matching.
 
     Example
     -------
@@ -72,7 +101,8 @@ class Instruction(namedtuple('Instruction', [
             'I would I knew not why it should be slow'd',
             [ 'Aside'],
             [ None ],
-            'Friar Laurence'
+            'Friar Laurence',
+            [ Action.ASIDE ]
             )
     """
     TYPE = 'instruction'
@@ -55,5 +55,25 @@ ACT_MATCHER = re.compile(ACT_PATTERN, re.IGNORECASE)
 SCENE_PATTERN = r"<h3>scene (?P<scene>[IVX]+).*</h3>"
 SCENE_MATCHER = re.compile(SCENE_PATTERN, re.IGNORECASE)
 
+"""
+LINE_MATCHER
+------------
+All of the above (bar INSTRUCTION_MATCHER) combined into a single regex, so
+that a line can be classified in one scan. The alternatives are tried in the
+same order as the cascade in `parse.parse_raw_text`, and each is anchored to
+the start of the line (with a lazy `.*?` prefix for those that are searched
+for rather than matched), so the first alternative to match wins. The name of
+the alternative is given by `match.lastgroup`.
+"""
+
+LINE_PATTERN = r'^(?:' \
+    r'(?P<DIALOGUE><a name="?(?P<dialogue_act>\d+)\.(?P<dialogue_scene>\d+)' \
+    r'\.\d+"?>(\[(?P<instruction>.*)\])?(?P<dialogue>.*)</a><br>)' \
+    r'|(?P<CHARACTER><a name="?speech\d+"?><b>(?P<name>.*)</b></a>)' \
+    r'|(?P<STAGE_DIRECTION>.*?<i>(?P<stage_direction>.*)</i>)' \
+    r'|(?P<ACT>.*?<h3>act (?P<act>[IVX]+).*</h3>)' \
+    r'|(?P<SCENE>.*?<h3>scene (?P<scene>[IVX]+).*</h3>))'
+LINE_MATCHER = re.compile(LINE_PATTERN, re.IGNORECASE)
+
 matcher = Matcher(DIALOGUE_MATCHER, CHARACTER_MATCHER, STAGE_DIRECTION_MATCHER,
-        INSTRUCTION_MATCHER, ACT_MATCHER, SCENE_MATCHER)
+        INSTRUCTION_MATCHER, ACT_MATCHER, SCENE_MATCHER, LINE_MATCHER)
@@ -1,6 +1,7 @@
 from utils import get_matcher
 from lookup import ROMAN_TO_INT 
-from lines import Dialogue, Character, Instruction, Act, Scene
+from lines import Dialogue, Character, Instruction, Act, Scene, Action
+from instrument import span, count
 
 def get_speaking_characters(raw_play_lines, character_matcher):
     """ Return a set of all character names 
@@ -41,6 +42,7 @@ def parse_raw_text(raw_play_lines, speaking_characters, matcher):
         instruction : no name, uses index 0
         act : 'act'
         scene : 'scene'
+        line : see `parse_play`, unused here
         
     Notes
     -----
@@ -111,6 +113,107 @@ def parse_raw_text(raw_play_lines, speaking_characters, matcher):
     return parsed_lines
 
 
+def tokenize(raw_play_lines, matcher):
+    """ Classify each line with one scan of the combined `matcher.line`
+    regex, lazily.
+
+    Parameters
+    ----------
+    raw_play_lines : iterable of str
+        lines of the play
+    matcher : namedtuple
+        as in `parse_raw_text`, `line` must be a compiled regex whose
+        alternatives are the groups 'DIALOGUE', 'CHARACTER',
+        'STAGE_DIRECTION', 'ACT' and 'SCENE', with the same inner groups as
+        their standalone matchers, bar 'dialogue_act' and 'dialogue_scene' for
+        the act and scene of the dialogue.
+
+    Once every line is scanned, they are counted as 'regex_calls'.
+
+    Yields
+    ------
+    (line, raw_instruction, default_character)
+        For each line that is not ignored. If the line is a stage direction,
+        or dialogue with an embedded one, the text of the stage direction is
+        given by raw_instruction, and should be resolved with
+        `resolve_instruction`, else raw_instruction is None. Stage directions
+        are given as None.
+    """
+    character_chain = []
+    # counted here, as raw_play_lines may be a generator with no len
+    scanned = 0
+    for scanned, line in enumerate(raw_play_lines, 1):
+        match = matcher.line.match(line)
+        if not match:
+            continue
+        kind = match.lastgroup
+        if kind == 'DIALOGUE':
+            character = character_chain[-1]
+            yield (Dialogue(
+                    match.group('dialogue'),
+                    None,
+                    character,
+                    match.group('dialogue_act'),
+                    match.group('dialogue_scene')),
+                match.group('instruction'),
+                character)
+        elif kind == 'CHARACTER':
+            name = match.group('name').upper()
+            character_chain.append(name)
+            yield Character(name), None, None
+        elif kind == 'STAGE_DIRECTION':
+            prev_character = character_chain[-1] if character_chain else None
+            yield None, match.group('stage_direction'), prev_character
+        elif kind == 'ACT':
+            yield Act(ROMAN_TO_INT[match.group('act')]), None, None
+        elif kind == 'SCENE':
+            yield Scene(ROMAN_TO_INT[match.group('scene')]), None, None
+    count('regex_calls', scanned)
+
+def resolve_instruction(line, raw_instruction, default_character,
+        known_characters_matcher, instruction_matcher):
+    """ Complete a line yielded by `tokenize` by processing its instruction
+    """
+    if raw_instruction is None:
+        return line
+    instruction = process_instructions(
+            raw_instruction,
+            known_characters_matcher,
+            instruction_matcher,
+            default_character)
+    return instruction if line is None \
+            else line._replace(instruction=instruction)
+
+def parse_play(raw_play_lines, matcher):
+    """ Single pass equivalent of `get_speaking_characters` followed by
+    `parse_raw_text`.
+
+    Each line is classified by `tokenize`, and speaking characters are
+    collected as they are found. Since a stage direction may name a character
+    who has yet to speak, instructions are only resolved once the scan is
+    done and every name is known.
+
+    Returns
+    -------
+    speaking_characters : set of str
+    play_lines : list of namedtuple
+    """
+    with span('tokenize'):
+        tokens = list(tokenize(raw_play_lines, matcher))
+    speaking_characters = { line.character for line, _, _ in tokens
+            if line is not None and line.TYPE == Character.TYPE }
+    with span('resolve_instructions'):
+        known_characters_matcher = get_matcher(speaking_characters,
+                "character")
+        parsed_lines = [ resolve_instruction(line, raw_instruction,
+            default_character, known_characters_matcher,
+            matcher.instruction)
+            for line, raw_instruction, default_character in tokens ]
+    count('lines', len(parsed_lines))
+    count('instructions', sum(1 for _, raw_instruction, _ in tokens
+        if raw_instruction is not None))
+    return speaking_characters, parsed_lines
+
 def process_instructions(instruction, known_characters_matcher,
         instruction_matcher, default_character):
     """
@@ -122,6 +225,8 @@ def process_instructions(instruction, known_characters_matcher,
     if instruction is None:
         return None
     instruction_lines = instruction.split(".")
+    # an action search and a character findall per sentence
+    count('regex_calls', 2 * len(instruction_lines))
     actions = [ match.group(0) if match else None for match in 
             ( instruction_matcher.search(line) 
                 for line in instruction_lines ) ]
@@ -131,10 +236,9 @@ def process_instructions(instruction, known_characters_matcher,
             for known_characters in
             ( known_characters_matcher.findall(line) 
                 for line in instruction_lines) ]
-    return Instruction(instruction, actions, characters, default_character)
+    events = [ Action.classify(action) for action in actions ]
+    return Instruction(instruction, actions, characters, default_character,
+            events)
 
 def preprocess(raw_play_lines, matcher):
-    speaking_characters = get_speaking_characters(raw_play_lines,
-            matcher.character)
-    play_lines = parse_raw_text(raw_play_lines, speaking_characters, matcher)
-    return speaking_characters, play_lines
+    return parse_play(raw_play_lines, matcher)
@@ -0,0 +1,130 @@
+import hashlib
+import json
+from collections import namedtuple
+
+from cache import get_source_hash, load, store, MAX_CACHE_SIZE
+from instrument import span, count
+
+"""
+INCREMENTAL PIPELINE
+====================
+
+Runs a DAG of stages, caching the output of each, and recomputing only the
+stages whose inputs have changed.
+
+The inputs of the pipeline (sources), such as the html of a play, its gender
+file and parameters, are hashed. The key of a stage is the hash of its name,
+the source of the modules it depends on, and the keys of its inputs, so it
+changes exactly when anything upstream of the stage changes, and can be
+worked out without running anything. Stages are then evaluated on demand: a
+stage whose key is in the cache is loaded, without evaluating its inputs.
+
+For example, in `run.create_play_pipeline`, editing a gender file changes
+the keys of gender_stats and postprocess, but not of parse_and_process, which
+is loaded from the cache rather than parsed again.
+"""
+
+Stage = namedtuple('Stage', ['function', 'inputs', 'modules', 'version'])
+Stage.__new__.__defaults__ = ((), 0)
+Stage.__doc__ = """ Parameters
+    ----------
+    function : function
+        called with the value of each of inputs, in order. Its output must be
+        picklable, and not None.
+    inputs : list of str
+        names of other stages or of sources
+    modules : list of str
+        modules whose source the output depends on, see
+        `cache.get_source_hash`
+    version : int
+        bump to invalidate cached outputs for reasons not in modules
+    """
+
+def hash_value(value):
+    """ Hash of a source, either lines of text (such as raw_play_lines) or
+    anything json can encode """
+    digest = hashlib.sha256()
+    if isinstance(value, list) and all(isinstance(x, str) for x in value):
+        for line in value:
+            digest.update(line.encode('utf-8'))
+    else:
+        digest.update(json.dumps(value, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+class Pipeline:
+    """ Parameters
+    ----------
+    stages : dict
+        maps the name of each stage to its Stage
+    cache_dir : str, optional
+        where stage outputs are cached, see cache.py. If None nothing is
+        cached.
+
+    Attributes
+    ----------
+    computed : list of str
+        stages computed, rather than loaded, by the last call to run
+    """
+    def __init__(self, stages, cache_dir=None, max_size=MAX_CACHE_SIZE):
+        self.stages = stages
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.computed = []
+        self._source_hashes = dict()
+
+    def get_key(self, name, source_keys, keys):
+        if name in keys:
+            return keys[name]
+        if name not in self.stages:
+            key = source_keys[name]
+        else:
+            stage = self.stages[name]
+            modules = (tuple(stage.modules), stage.version)
+            if modules not in self._source_hashes:
+                self._source_hashes[modules] = get_source_hash(*modules)
+            digest = hashlib.sha256(name.encode('utf-8'))
+            digest.update(self._source_hashes[modules].encode())
+            for input_name in stage.inputs:
+                digest.update(self.get_key(input_name, source_keys,
+                    keys).encode())
+            key = digest.hexdigest()
+        keys[name] = key
+        return key
+
+    def run(self, sources, targets):
+        """ Evaluate each of targets, given the value of every source.
+
+        Returns
+        -------
+        values : dict
+            maps each target to its value
+        """
+        source_keys = { name : hash_value(value) for name, value in
+                sources.items() }
+        keys = dict()
+        values = dict(sources)
+        self.computed = []
+
+        def evaluate(name):
+            if name in values:
+                return values[name]
+            stage = self.stages[name]
+            key = self.get_key(name, source_keys, keys)
+            value = None
+            if self.cache_dir is not None:
+                value = load(self.cache_dir, key)
+            if value is None:
+                arguments = [ evaluate(input_name) for input_name in
+                        stage.inputs ]
+                with span(name):
+                    value = stage.function(*arguments)
+                self.computed.append(name)
+                count('stages_computed')
+                if self.cache_dir is not None:
+                    store(self.cache_dir, key, value, self.max_size)
+            else:
+                count('stages_loaded')
+            values[name] = value
+            return value
+
+        return { target : evaluate(target) for target in targets }
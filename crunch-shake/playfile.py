@@ -0,0 +1,298 @@
+import json
+import struct
+
+import numpy as np
+
+from lines import Dialogue, Character, Instruction, Act, Scene, Action
+from table import LINE_TYPES, TYPE_CODE, DIALOGUE, CHARACTER, INSTRUCTION, \
+        ACT, NO_ID
+
+"""
+PLAY FILES
+==========
+
+Versioned binary format for parsed plays, replacing the repr based .out
+files, which could not be read back.
+
+A play file is
+
+    MAGIC, FORMAT_VERSION (uint32), header length (uint32), header (json)
+
+followed by the columns of the play, each a little endian array aligned to 8
+bytes, at the offsets given in the header. The columns mirror those of
+`table.PlayTable`, except that all strings (names, actions, stage directions)
+are interned in one string pool and referred to by their index in it, and
+dialogue is one utf-8 blob with byte offsets.
+
+Reading a play memory maps the file and views each column in place, so
+opening a play costs next to nothing, and lines are only decoded into `lines`
+namedtuples when accessed.
+"""
+
+MAGIC = b'CRSHPLAY'
+FORMAT_VERSION = 1
+SUFFIX = '.play'
+
+PREAMBLE = struct.Struct('<8sII')
+ALIGNMENT = 8
+
+# name -> dtype of every column
+COLUMNS = [
+    # one entry per line
+    ('types', '<i1'),
+    ('character_ids', '<i4'),
+    ('acts', '<i4'),
+    ('scenes', '<i4'),
+    ('instruction_ids', '<i4'),
+    # one more entry than lines, text[offsets[i]:offsets[i + 1]] is the
+    # dialogue of line i
+    ('text_offsets', '<i8'),
+    ('text', '<u1'),
+    # one entry per instruction
+    ('instruction_raw', '<i4'),
+    ('instruction_default_character', '<i4'),
+    ('instruction_action_offsets', '<i8'),
+    # one entry per action of an instruction
+    ('action_names', '<i4'),
+    ('action_events', '<i1'),
+    ('action_character_offsets', '<i8'),
+    # one entry per character of an action
+    ('action_characters', '<i4'),
+    ('pool_offsets', '<i8'),
+    ('pool', '<u1'),
+    ]
+
+def write_play(path, play_lines, **metadata):
+    """ Write play_lines, a list of `lines` namedtuples or a
+    `table.PlayTable`, to path. metadata, e.g. title, is stored in the header
+    as json. """
+    pool = []
+    pool_id = dict()
+    def intern(string):
+        if string is None:
+            return NO_ID
+        if string not in pool_id:
+            pool_id[string] = len(pool)
+            pool.append(string)
+        return pool_id[string]
+
+    columns = { name : [] for name, _ in COLUMNS }
+    columns['text_offsets'].append(0)
+    columns['instruction_action_offsets'].append(0)
+    columns['action_character_offsets'].append(0)
+    text = []
+    text_length = 0
+    instruction_id = dict()
+    act = scene = 0
+
+    # instructions shared by several lines are stored once. A PlayTable
+    # already numbers them, else they are told apart by identity, keeping a
+    # reference to each, so that the id of one freed by a generator of lines
+    # is not reused by another
+    instruction_keys = getattr(play_lines, 'instruction_ids', None)
+    seen = []
+
+    def add_instruction(instruction, key):
+        if key not in instruction_id:
+            seen.append(instruction)
+            instruction_id[key] = len(columns['instruction_raw'])
+            columns['instruction_raw'].append(intern(instruction.raw))
+            columns['instruction_default_character'].append(
+                    intern(instruction.default_character))
+            for action, characters, event in zip(instruction.actions,
+                    instruction.characters, instruction.events):
+                columns['action_names'].append(intern(action))
+                columns['action_events'].append(event)
+                columns['action_characters'].extend(
+                        intern(character) for character in characters)
+                columns['action_character_offsets'].append(
+                        len(columns['action_characters']))
+            columns['instruction_action_offsets'].append(
+                    len(columns['action_names']))
+        return instruction_id[key]
+
+    for i, line in enumerate(play_lines):
+        code = TYPE_CODE[line.TYPE]
+        character = instruction = None
+        dialogue = b''
+        if code == DIALOGUE:
+            character = line.character
+            instruction = line.instruction
+            dialogue = line.dialogue.encode('utf-8')
+            act, scene = int(line.act), int(line.scene)
+        elif code == CHARACTER:
+            character = line.character
+        elif code == INSTRUCTION:
+            instruction = line
+        elif code == ACT:
+            act = line.act
+        else:
+            scene = line.scene
+        columns['types'].append(code)
+        columns['character_ids'].append(intern(character))
+        columns['acts'].append(act)
+        columns['scenes'].append(scene)
+        columns['instruction_ids'].append(NO_ID if instruction is None
+                else add_instruction(instruction, id(instruction)
+                    if instruction_keys is None else instruction_keys[i]))
+        text.append(dialogue)
+        text_length += len(dialogue)
+        columns['text_offsets'].append(text_length)
+    columns['text'] = np.frombuffer(b''.join(text), dtype=np.uint8)
+
+    encoded_pool = [ string.encode('utf-8') for string in pool ]
+    columns['pool'] = np.frombuffer(b''.join(encoded_pool), dtype=np.uint8)
+    columns['pool_offsets'] = np.cumsum([0] + [ len(string) for string in
+        encoded_pool ])
+
+    arrays = [ (name, np.asarray(columns[name], dtype=dtype))
+            for name, dtype in COLUMNS ]
+    # offsets are relative to the end of the header, whose length depends on
+    # them
+    layout = dict()
+    offset = 0
+    for name, array in arrays:
+        layout[name] = [array.dtype.str, offset, len(array)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({'lines' : len(columns['types']),
+        'columns' : layout, 'metadata' : metadata}).encode('utf-8')
+    header += b' ' * (-(PREAMBLE.size + len(header)) % ALIGNMENT)
+
+    with open(path, 'wb') as playFile:
+        playFile.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        playFile.write(header)
+        for name, array in arrays:
+            playFile.write(array.tobytes())
+            playFile.write(b'\0' * (-array.nbytes % ALIGNMENT))
+
+class PlayFile:
+    """ Read only, lazy view of a play written by `write_play`, with the same
+    interface as `table.PlayTable`: indexing or iterating gives `lines`
+    namedtuples, decoded on access.
+
+    Parameters
+    ----------
+    path : str
+
+    Attributes
+    ----------
+    metadata : dict
+        as given to `write_play`
+    types, character_ids, acts, scenes, instruction_ids : numpy array
+        columns of `table.PlayTable`, viewing the memory mapped file, with
+        character_ids indexing the string pool
+
+    Raises
+    ------
+    ValueError
+        if path is not a play file, or of an unsupported version
+    """
+    def __init__(self, path):
+        self._buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, header_length = PREAMBLE.unpack_from(self._buffer)
+        if magic != MAGIC:
+            raise ValueError(path + " is not a play file")
+        if version != FORMAT_VERSION:
+            raise ValueError("{0} has format version {1}, expected {2}"
+                    .format(path, version, FORMAT_VERSION))
+        header_end = PREAMBLE.size + header_length
+        header = json.loads(bytes(
+            self._buffer[PREAMBLE.size:header_end]).decode('utf-8'))
+        self.metadata = header['metadata']
+        self._length = header['lines']
+        for name, (dtype, offset, count) in header['columns'].items():
+            setattr(self, name, np.frombuffer(self._buffer, dtype=dtype,
+                count=count, offset=header_end + offset))
+        self._strings = dict()
+        self._instructions = dict()
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self.line(j) for j in range(*i.indices(len(self))) ]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('PlayFile index out of range')
+        return self.line(i)
+
+    def __iter__(self):
+        return ( self.line(i) for i in range(len(self)) )
+
+    def string(self, string_id):
+        """ String of the pool with string_id, None for NO_ID """
+        if string_id == NO_ID:
+            return None
+        if string_id not in self._strings:
+            start, end = self.pool_offsets[string_id:string_id + 2]
+            self._strings[string_id] = bytes(self.pool[start:end]) \
+                    .decode('utf-8')
+        return self._strings[string_id]
+
+    @property
+    def characters(self):
+        """ Names of the characters who speak, in order of first appearance
+        """
+        ids = self.character_ids[self.character_ids != NO_ID]
+        _, first = np.unique(ids, return_index=True)
+        return [ self.string(string_id) for string_id in ids[np.sort(first)] ]
+
+    def character(self, i):
+        return self.string(int(self.character_ids[i]))
+
+    def dialogue(self, i):
+        start, end = self.text_offsets[i:i + 2]
+        return bytes(self.text[start:end]).decode('utf-8')
+
+    def instruction(self, i):
+        instruction_id = int(self.instruction_ids[i])
+        if instruction_id == NO_ID:
+            return None
+        if instruction_id not in self._instructions:
+            self._instructions[instruction_id] = self._read_instruction(
+                    instruction_id)
+        return self._instructions[instruction_id]
+
+    def _read_instruction(self, instruction_id):
+        start, end = self.instruction_action_offsets[
+                instruction_id:instruction_id + 2]
+        actions = []
+        characters = []
+        events = []
+        for action in range(start, end):
+            actions.append(self.string(int(self.action_names[action])))
+            events.append(Action(int(self.action_events[action])))
+            first, last = self.action_character_offsets[action:action + 2]
+            characters.append([ self.string(string_id) for string_id in
+                self.action_characters[first:last].tolist() ])
+        return Instruction(self.string(int(self.instruction_raw[
+            instruction_id])), actions, characters, self.string(int(
+                self.instruction_default_character[instruction_id])), events)
+
+    def iter_dialogue(self):
+        """ (index, character, dialogue) of every line of dialogue, without
+        building the namedtuples """
+        for i in np.flatnonzero(self.types == DIALOGUE).tolist():
+            yield i, self.character(i), self.dialogue(i)
+
+    def line(self, i):
+        """ namedtuple view of line i """
+        line_type = LINE_TYPES[self.types[i]]
+        if line_type is Dialogue:
+            return Dialogue(self.dialogue(i), self.instruction(i),
+                    self.character(i), str(self.acts[i]),
+                    str(self.scenes[i]))
+        elif line_type is Character:
+            return Character(self.character(i))
+        elif line_type is Instruction:
+            return self.instruction(i)
+        elif line_type is Act:
+            return Act(int(self.acts[i]))
+        else:
+            return Scene(int(self.scenes[i]))
+
+def read_play(path):
+    """ Open the play file at path, see PlayFile """
+    return PlayFile(path)
@@ -1,5 +1,12 @@
-from lines import Dialogue, Character, Instruction, Act, Scene
-from utils import invert_dict
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lines import Action, ENTERING, EXITING
+from table import (DIALOGUE, CHARACTER, INSTRUCTION, ACT, SCENE, as_table,
+        iter_dialogue)
+from instrument import span
 
 def get_act_scene_range(play_lines):
     """
@@ -17,18 +24,20 @@ def get_act_scene_range(play_lines):
         contains start of all act/scenes as well as the index of the last line
         + 1 (so basically len(play_lines) appended)
     """
+    play_lines = as_table(play_lines)
+    types = play_lines.types
     act_scenes = []
     act_scene_range = []
-    for i, line in enumerate(play_lines):
-        if line.TYPE == Scene.TYPE:
-            prev_line = play_lines[i - 1]
-            if prev_line.TYPE == Act.TYPE:
-                act_scenes.append((prev_line.act, line.scene))
+    for i, code in enumerate(types):
+        if code == SCENE:
+            if types[i - 1] == ACT:
+                act_scenes.append((play_lines[i - 1].act,
+                    play_lines[i].scene))
                 act_scene_range.append(i - 1)
             else:
                 act_scenes.append((
                     act_scenes[-1][0] if act_scenes else 1,
-                    line.scene))
+                    play_lines[i].scene))
                 act_scene_range.append(i)
     act_scene_range.append(len(play_lines))
     # make sure that the beginning is part of an act, scene
@@ -39,10 +48,11 @@ def get_act_scene_range(play_lines):
 
 def get_entrance_exit(play_lines, act_scene_start_end):
     """
-    For each character in the play, entrance[character] gives the line
-    numbers, of `play_lines`, for when they enter a scene. exit[character] does
-    the same for when the characters exit
+    For each scene in the play, entrance[scene][character] gives the line
+    numbers, of `play_lines`, for when they enter the scene.
+    exit[scene][character] does the same for when the characters exit
     """
+    play_lines = as_table(play_lines)
     entrance_exit = [ 
             entrance_exit_by_scene(play_lines, scene_start, scene_end)
             for scene_start, scene_end in act_scene_start_end ]
@@ -50,131 +60,261 @@ def get_entrance_exit(play_lines, act_scene_start_end):
     return entrance, exit
 
 def entrance_exit_by_scene(play_lines, scene_start, scene_end):
-    """ 
-    Note
-    ----
-    If character enters, exit and re-enters, scene_entrance will note only
-    first entrance; scene_exit will note only first exit.
+    """ Sweep through the scene once, keeping track of who is on stage.
 
-    scene_exit gives the last line for each character inclusive.
+    A character enters or exits when named in a stage direction whose action
+    is entering or exiting, or if none are named, the default character does.
+    A bare 'Exeunt' clears the stage. A character who speaks while off stage
+    has been on stage since the start of the scene (or since the stage was
+    last cleared) if this is their first appearance, else they have
+    re-entered on that line. Whoever is on stage at the end of the scene exits
+    on its last line.
+
+    Returns
+    -------
+    scene_entrance, scene_exit : dict of str to list of int
+        The lines on which each character enters and exits, both inclusive,
+        with the nth exit closing the nth entrance. Every entrance is noted,
+        so characters who exit and re-enter have more than one.
     """
+    play_lines = as_table(play_lines)
+    types = play_lines.types
     scene_entrance = dict()
     scene_exit = dict()
-    character_start = create_check_and_add(scene_entrance, scene_start)
-    character_end = create_check_and_add(
-            scene_exit, 
-            scene_end, 
-            entering=False)
-    for i in range(scene_start, scene_end):
-        line = play_lines[i]
-        character_start(line, i)
-    for i in reversed(range(scene_start, scene_end)):
-        line = play_lines[i]
-        character_end(line, i)
-    # ensure that characters have both entrance and exit
-    close_loose_characters(scene_entrance, scene_exit, scene_end - 1)
-    close_loose_characters(scene_exit, scene_entrance, scene_start)
-    return scene_entrance, scene_exit
+    on_stage = set()
+    # the line from which characters appearing for the first time are present
+    since = [scene_start]
+
+    def enter(character, i):
+        if character not in on_stage:
+            on_stage.add(character)
+            scene_entrance.setdefault(character, []).append(i)
 
-def close_loose_characters(characters_one, characters_two, default_line_number):
-    for character in (characters_one.keys() - characters_two.keys()):
-        characters_two[character] = default_line_number
-
-def create_check_and_add(scene, default, entering=True):
-    add_if_not_in = create_add_if_not_in(scene)
-    patterns = ['enter'] if entering else ['exit', 'exeunt']
-    def check_and_add(line, i):
-        if line.TYPE == Character.TYPE:
-            add_if_not_in(line.character, default)
-        elif line.TYPE == Instruction.TYPE:
-            instruction_character_start(
-                    line, 
-                    i, 
-                    patterns,
-                    add_if_not_in
-                    )
-        elif line.TYPE == Dialogue.TYPE:
-            add_if_not_in(line.character, default)
-            instruction = line.instruction
+    def leave(character, i):
+        if character in on_stage:
+            on_stage.remove(character)
+            scene_exit.setdefault(character, []).append(i)
+        elif character not in scene_entrance:
+            scene_entrance[character] = [since[0]]
+            scene_exit[character] = [i]
+
+    def speak(character, i):
+        if character not in on_stage:
+            enter(character, i if character in scene_entrance else since[0])
+
+    def direct(instruction, i):
+        for event, characters in zip(instruction.events,
+                instruction.characters):
+            if event in ENTERING:
+                for character in characters or \
+                        [ instruction.default_character ]:
+                    if character:
+                        enter(character, i)
+            elif event in EXITING:
+                if characters:
+                    for character in characters:
+                        leave(character, i)
+                elif event == Action.EXEUNT:
+                    for character in sorted(on_stage):
+                        leave(character, i)
+                    since[0] = i + 1
+                elif instruction.default_character:
+                    leave(instruction.default_character, i)
+
+    # only the type, speaker and instruction of each line are needed, so they
+    # are read from the table rather than building each line's namedtuple
+    for i in range(scene_start, scene_end):
+        code = types[i]
+        if code == CHARACTER:
+            speak(play_lines.character(i), i)
+        elif code == INSTRUCTION:
+            direct(play_lines.instruction(i), i)
+        elif code == DIALOGUE:
+            speak(play_lines.character(i), i)
+            instruction = play_lines.instruction(i)
             if instruction:
-                instruction_character_start(
-                        instruction, 
-                        i, 
-                        patterns,
-                        add_if_not_in
-                        )
-    return check_and_add
-
-def instruction_character_start(instruction, line_index, patterns,
-        add_if_not_in):
-    """ 
-    determine if instruction contains enter/exit type action and add_if_not_in
-    either default_character or characters in instruction
-    """
-    for i, action in enumerate(instruction.actions):
-        if pattern_in(patterns, action):
-            if not instruction.characters[i]:
-                if instruction.default_character:
-                    add_if_not_in(instruction.default_character, line_index)
-            for character in instruction.characters[i]:
-                add_if_not_in(character, line_index)
-
-def create_add_if_not_in(scene_characters):
-    def add_if_not_in(character, i):
-        if character not in scene_characters:
-            scene_characters[character] = i
-    return add_if_not_in
-
-def pattern_in(patterns, action):
-    return action and any(pattern in action.lower() for pattern in patterns)
+                direct(instruction, i)
+    for character in on_stage:
+        scene_exit.setdefault(character, []).append(scene_end - 1)
+    return scene_entrance, scene_exit
 
 def get_presence(speaking_characters, play_lines, act_scene_start_end,
         entrance, exit):
+    characters = sorted(speaking_characters)
+    character_id = { character : i for i, character in enumerate(characters) }
+    dialogue_lines, speakers = get_dialogue_speakers(play_lines, character_id)
     adj = { character : dict() for character in speaking_characters }
     for i, start_end in enumerate(act_scene_start_end):
         get_presence_by_scene(
                 adj, 
-                play_lines, 
+                characters,
+                character_id,
+                dialogue_lines,
+                speakers,
                 start_end, 
                 entrance[i], 
                 exit[i])
     return adj
 
-def get_presence_by_scene(adj, play_lines, start_end, scene_entrance,
-        scene_exit):
+def get_dialogue_speakers(play_lines, character_id):
+    """ Returns arrays of the index of every line of dialogue in play_lines,
+    and the id (given by character_id) of the character who speaks it """
+    dialogue = [ (i, character_id[character]) for i, character, _ in
+            iter_dialogue(play_lines) ]
+    dialogue_lines = np.array([ i for i, _ in dialogue ], dtype=np.int64)
+    speakers = np.array([ speaker for _, speaker in dialogue ],
+            dtype=np.int64)
+    return dialogue_lines, speakers
+
+def get_presence_by_scene(adj, characters, character_id, dialogue_lines,
+        speakers, start_end, scene_entrance, scene_exit):
     """ Given the points at which characters entered and exited a screen,
     construct adj which gives which lines were spoken to whom.
+
+    A character is present from each entrance up to and including the exit
+    that closes it, so presence is computed as a (time on stage x line of
+    dialogue) bitmap over the scene, with the speaker of each line masked
+    out. The (speaker, listener) pairs of the bitmap are then grouped with a
+    stable sort so that the lines of each pair stay in order.
     """
     scene_start, scene_end = start_end
-    characters_present = set()
-    inv_entrance, inv_exit = map(invert_dict, [scene_entrance, scene_exit])
-    for i in range(scene_start, scene_end):
-        line = play_lines[i]
-        if i in inv_entrance:
-            for character in inv_entrance[i]:
-                characters_present.add(character)
-        if line.TYPE == Dialogue.TYPE:
-            for character in characters_present - {line.character}:
-                if character in adj[line.character]:
-                    adj[line.character][character].append(i)
-                else:
-                    adj[line.character][character] = [i]
-        if i in inv_exit:
-            for character in inv_exit[i]:
-                try:
-                    characters_present.remove(character)
-                except KeyError:
-                    print(i)
-                    print(line)
-                    exit()
-
-def process(speaking_characters, play_lines):
+    lo, hi = np.searchsorted(dialogue_lines, [scene_start, scene_end])
+    if lo == hi or not scene_entrance:
+        return
+    lines = dialogue_lines[lo:hi]
+    scene_speakers = speakers[lo:hi]
+    on_stage = [ (character_id[character], enter, leave)
+            for character in scene_entrance
+            for enter, leave in zip(scene_entrance[character],
+                scene_exit[character]) ]
+    ids, enter, leave = map(np.array, zip(*on_stage))
+
+    presence = (lines >= enter[:, None]) & (lines <= leave[:, None])
+    presence &= ids[:, None] != scene_speakers[None, :]
+    listener_rows, columns = np.nonzero(presence)
+    if not len(columns):
+        return
+    n = len(characters)
+    pairs = scene_speakers[columns] * n + ids[listener_rows]
+    order = np.argsort(pairs, kind='stable')
+    pairs = pairs[order]
+    pair_lines = lines[columns[order]]
+
+    boundaries = np.flatnonzero(np.diff(pairs)) + 1
+    for start, pair_line_group in zip(np.concatenate(([0], boundaries)),
+            np.split(pair_lines, boundaries)):
+        speaker, listener = divmod(int(pairs[start]), n)
+        spoken = adj[characters[speaker]]
+        listener = characters[listener]
+        if listener in spoken:
+            spoken[listener].extend(pair_line_group.tolist())
+        else:
+            spoken[listener] = pair_line_group.tolist()
+
+# SCENE PARALLELISM
+# Scenes are independent, so process can split them into contiguous runs of
+# scenes, process each run in a worker, and merge the adj fragments in order.
+
+# plays shorter than this are processed serially whatever the jobs asked for,
+# as starting the pool and sending each worker the play takes longer than
+# processing them does (the pool costs about a tenth of a second, in which
+# some 50000 lines are processed serially)
+PARALLEL_MIN_LINES = 100000
+
+# each worker is given about this many runs of scenes, rather than one, so
+# that a worker whose scenes are quick to process takes on another run while
+# the others finish, at the cost of a few more adj fragments to merge
+RUNS_PER_JOB = 4
+
+# the play of this worker process, set by init_scene_worker
+_worker_play = None
+
+def init_scene_worker(speaking_characters, play_lines):
+    """ Set up a worker process with the play, once, rather than sending it
+    along with each run of scenes """
+    global _worker_play
+    characters = sorted(speaking_characters)
+    character_id = { character : i for i, character in enumerate(characters) }
+    dialogue_lines, speakers = get_dialogue_speakers(play_lines, character_id)
+    _worker_play = (play_lines, characters, character_id, dialogue_lines,
+            speakers)
+
+def process_scenes(scene_start_end):
+    """ (entrance, exit, adj) of a run of scenes of the worker's play, adj
+    holding only the speakers who speak to someone """
+    play_lines, characters, character_id, dialogue_lines, speakers = \
+            _worker_play
+    entrance, exit = get_entrance_exit(play_lines, scene_start_end)
+    adj = { character : dict() for character in characters }
+    for start_end, scene_entrance, scene_exit in zip(scene_start_end,
+            entrance, exit):
+        get_presence_by_scene(adj, characters, character_id, dialogue_lines,
+                speakers, start_end, scene_entrance, scene_exit)
+    return entrance, exit, { speaker : spoken for speaker, spoken in
+            adj.items() if spoken }
+
+def partition_scenes(act_scene_start_end, parts):
+    """ Split the scenes into at most parts contiguous runs of about as many
+    lines each """
+    if not act_scene_start_end:
+        return []
+    total = act_scene_start_end[-1][1] - act_scene_start_end[0][0]
+    runs = [[]]
+    for start, end in act_scene_start_end:
+        if runs[-1] and (start - act_scene_start_end[0][0]) * parts \
+                >= total * len(runs):
+            runs.append([])
+        runs[-1].append((start, end))
+    return runs
+
+def merge_adj(adj, fragment):
+    """ Add the lines of an adj fragment to adj. Fragments must be merged in
+    the order of their scenes, so that the lines of each pair stay in order.
+    """
+    for speaker, spoken in fragment.items():
+        for listener, lines in spoken.items():
+            adj[speaker].setdefault(listener, []).extend(lines)
+
+def process_parallel(speaking_characters, play_lines, act_scene_start_end,
+        jobs):
+    """ get_entrance_exit and get_presence over a pool of jobs processes,
+    giving the same entrance, exit and adj """
+    runs = partition_scenes(act_scene_start_end, RUNS_PER_JOB * jobs)
+    entrance, exit = [], []
+    adj = { character : dict() for character in speaking_characters }
+    with ProcessPoolExecutor(max_workers=jobs,
+            initializer=init_scene_worker,
+            initargs=(speaking_characters, play_lines)) as executor:
+        for run_entrance, run_exit, fragment in executor.map(
+                process_scenes, runs):
+            entrance.extend(run_entrance)
+            exit.extend(run_exit)
+            merge_adj(adj, fragment)
+    return entrance, exit, adj
+
+def process(speaking_characters, play_lines, jobs=None):
+    """ If jobs is more than one, the scenes are processed over a pool of
+    that many processes (at most one per cpu), see `process_parallel`, which
+    only pays off for very long plays, such as a concatenated cycle of
+    histories. Plays of fewer than PARALLEL_MIN_LINES lines, or when there is
+    only one cpu, are processed serially.
+
+    play_lines is best given as a `table.PlayTable`, else one is built. """
+    play_lines = as_table(play_lines)
     act_scenes, act_scene_range = get_act_scene_range(play_lines)
-    print(act_scenes[8])
     act_scene_start_end = list(zip(act_scene_range, act_scene_range[1:]))
-    entrance, exit = get_entrance_exit(
-            play_lines, 
-            act_scene_start_end)
+    if jobs is not None:
+        jobs = min(jobs, os.cpu_count() or 1)
+    if jobs is not None and jobs > 1 \
+            and len(play_lines) >= PARALLEL_MIN_LINES:
+        with span('process_parallel'):
+            entrance, exit, adj = process_parallel(speaking_characters,
+                    play_lines, act_scene_start_end, jobs)
+        return adj, act_scene_start_end
+    with span('get_entrance_exit'):
+        entrance, exit = get_entrance_exit(
+                play_lines,
+                act_scene_start_end)
     # print(act_scene_start_end[17])
     # print(entrance[5])
     # print(exit[5])
@@ -183,11 +323,12 @@ def process(speaking_characters, play_lines):
     # print(play_lines[0:20])
     # print(entrance)
     # print(exit)
-    adj = get_presence(
-            speaking_characters, 
-            play_lines, 
-            act_scene_start_end,
-            entrance, 
-            exit)
-    # print(adj['EUPHRONIUS']) # scene 23 
+    with span('get_presence'):
+        adj = get_presence(
+                speaking_characters,
+                play_lines,
+                act_scene_start_end,
+                entrance,
+                exit)
+    # print(adj['EUPHRONIUS']) # scene 23
     return adj, act_scene_start_end
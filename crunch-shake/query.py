@@ -0,0 +1,109 @@
+import argparse
+import pathlib
+import sqlite3
+
+"""
+QUERIES
+=======
+
+Corpus wide questions answered in SQL, from the database written by
+database.py, e.g.
+
+>>> columns, rows = query(connect('plays.sqlite'), QUERIES['bechdel'])
+
+or from the command line, by the name of one of QUERIES or as SQL
+
+    python query.py plays.sqlite bechdel
+    python query.py plays.sqlite "SELECT count(*) FROM lines"
+"""
+
+QUERIES = {
+    # percentage of scenes passing the test for each gender
+    'bechdel' : """
+        SELECT plays.name AS play,
+            max(CASE stats.name WHEN 'scenes' THEN value END) AS scenes,
+            round(100 * max(CASE stats.name WHEN 'female passes'
+                THEN value END) / max(CASE stats.name WHEN 'scenes'
+                THEN value END), 1) AS female,
+            round(100 * max(CASE stats.name WHEN 'male passes'
+                THEN value END) / max(CASE stats.name WHEN 'scenes'
+                THEN value END), 1) AS male
+        FROM plays JOIN stats USING (play_id)
+        GROUP BY play_id ORDER BY female DESC, play
+        """,
+    # lines of dialogue spoken by each gender in each play
+    'gender_lines' : """
+        SELECT plays.name AS play,
+            sum(gender = 'F') AS female,
+            sum(gender = 'M') AS male,
+            sum(gender = 'N') AS unisex,
+            sum(gender IS NULL) AS unknown
+        FROM lines JOIN characters USING (character_id)
+            JOIN plays ON plays.play_id = lines.play_id
+        WHERE type = 'dialogue'
+        GROUP BY lines.play_id ORDER BY play
+        """,
+    # characters with the most lines of dialogue
+    'speakers' : """
+        SELECT characters.name AS character, plays.name AS play, gender,
+            count(*) AS lines
+        FROM lines JOIN characters USING (character_id)
+            JOIN plays ON plays.play_id = lines.play_id
+        WHERE type = 'dialogue'
+        GROUP BY character_id ORDER BY lines DESC LIMIT 25
+        """,
+    # lines spoken from characters of one gender to those of another
+    'conversations' : """
+        SELECT speakers.gender AS speaker, listeners.gender AS listener,
+            count(*) AS lines
+        FROM edges
+            JOIN characters AS speakers
+                ON speakers.character_id = edges.speaker_id
+            JOIN characters AS listeners
+                ON listeners.character_id = edges.listener_id
+        GROUP BY speakers.gender, listeners.gender ORDER BY lines DESC
+        """,
+    }
+
+def connect(path):
+    """ Read only connection to the database at path """
+    # as a URI, so that characters such as ? and # in path are escaped
+    return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + '?mode=ro',
+            uri=True)
+
+def query(connection, sql, parameters=()):
+    """ (columns, rows) of sql """
+    cursor = connection.execute(sql, parameters)
+    columns = [ description[0] for description in cursor.description ]
+    return columns, cursor.fetchall()
+
+def print_table(columns, rows):
+    widths = [ max([len(str(column))] + [ len(str(row[i])) for row in rows ])
+            for i, column in enumerate(columns) ]
+    row_format = "  ".join("{:<" + str(width) + "}" for width in widths)
+    print(row_format.format(*columns))
+    for row in rows:
+        print(row_format.format(*[ str(x) for x in row ]))
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description="Query the database written by database.py")
+    parser.add_argument('database')
+    parser.add_argument('query',
+            help="one of " + ", ".join(QUERIES) + ", or SQL")
+    parser.add_argument('parameters', nargs='*',
+            help="values of the ? placeholders of the query")
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    connection = connect(args.database)
+    try:
+        print_table(*query(connection, QUERIES.get(args.query, args.query),
+            args.parameters))
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+RENDERING
+=========
+
+Lays out and draws the conversation graphs of many plays at once, by running
+Graphviz over a pool of workers, one task per (play, engine, format).
+
+Each output file is recorded in the output directory's .render.json with the
+hash of the edges and weights of the graph it was drawn from, and is skipped
+while the graph is unchanged. Every layout runs as its own Graphviz process
+with a timeout, so a huge graph (the history plays) is killed rather than
+stalling the batch.
+"""
+
+ENGINES = ('dot', 'circo')
+
+# Any Graphviz output format. plain gives the layout as text coordinates, and
+# json (Graphviz 2.40+) as json.
+FORMATS = ('png', 'svg', 'plain', 'json')
+
+RENDER_RECORD = '.render.json'
+
+def quote(x):
+    return '"' + str(x).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def to_dot(graph):
+    """ DOT source of a directed graph, such as that of
+    `analysis.create_graph`, with its nodes and edges sorted so that the same
+    graph gives the same source """
+    def attributes(data):
+        if not data:
+            return ""
+        return " [" + ", ".join(key + "=" + quote(data[key])
+                for key in sorted(data)) + "]"
+    lines = ["strict digraph {\n"]
+    for node in sorted(graph.nodes()):
+        lines.append("    " + quote(node) + attributes(graph.nodes[node])
+                + ";\n")
+    for speaker, spoken in sorted(graph.edges()):
+        lines.append("    " + quote(speaker) + " -> " + quote(spoken)
+                + attributes(graph.edges[speaker, spoken]) + ";\n")
+    lines.append("}\n")
+    return "".join(lines)
+
+def graph_hash(graph):
+    """ sha256 of the nodes, edges and edge weights of graph """
+    nodes = sorted(graph.nodes())
+    edges = sorted((speaker, spoken, data.get('weight'))
+            for speaker, spoken, data in graph.edges(data=True))
+    return hashlib.sha256(json.dumps([nodes, edges]).encode('utf-8')) \
+            .hexdigest()
+
+def get_output_file(output_path_base, engine, fmt):
+    return output_path_base + "_" + engine + "." + fmt
+
+def layout(dot_source, output_file, engine, fmt, timeout=None):
+    """ Lay out dot_source with the Graphviz engine, and write it to
+    output_file in fmt, replacing output_file only once Graphviz succeeds.
+
+    Raises
+    ------
+    subprocess.TimeoutExpired
+        if Graphviz takes longer than timeout seconds, in which case it is
+        killed
+    subprocess.CalledProcessError
+        if Graphviz fails
+    """
+    fd, temp_file = tempfile.mkstemp(
+            dir=os.path.dirname(output_file) or '.', suffix='.' + fmt)
+    os.close(fd)
+    try:
+        subprocess.run(['dot', '-K' + engine, '-T' + fmt, '-o', temp_file],
+                input=dot_source.encode('utf-8'), timeout=timeout,
+                check=True, stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE)
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def render_graphs(graphs, engines=ENGINES, formats=('png',), jobs=None,
+        timeout=60, force=False):
+    """ Write the .dot source of every graph, and draw it with every engine
+    in every format.
+
+    Parameters
+    ----------
+    graphs : dict
+        maps the output path base of a play (see `run.get_paths`) to its
+        graph. Files are written to output_path_base + '.dot' and
+        output_path_base + '_' + engine + '.' + fmt, e.g. output/hamlet_dot.png
+    jobs : int, optional
+        number of layouts run at once, defaults to the number of cpus
+    timeout : float, optional
+        seconds after which a layout is abandoned, None for no limit
+    force : bool
+        render even if the graph is unchanged since the last render
+
+    Returns
+    -------
+    statuses : dict
+        maps each output file to 'rendered', 'unchanged', 'timed out' or
+        'failed: <reason>'
+    """
+    records = dict()
+    def get_record(output_file):
+        record_path = os.path.join(os.path.dirname(output_file),
+                RENDER_RECORD)
+        if record_path not in records:
+            try:
+                with open(record_path, 'r') as recordFile:
+                    records[record_path] = json.load(recordFile)
+            except FileNotFoundError:
+                records[record_path] = dict()
+        return records[record_path]
+
+    def unchanged(output_file, current_hash):
+        return not force and os.path.exists(output_file) and \
+                get_record(output_file).get(os.path.basename(output_file)) \
+                == current_hash
+
+    statuses = dict()
+    tasks = []
+    for output_path_base, graph in graphs.items():
+        current_hash = graph_hash(graph)
+        dot_source = to_dot(graph)
+        dot_file = output_path_base + ".dot"
+        if unchanged(dot_file, current_hash):
+            statuses[dot_file] = 'unchanged'
+        else:
+            with open(dot_file, 'w') as outputFile:
+                outputFile.write(dot_source)
+            statuses[dot_file] = 'rendered'
+            get_record(dot_file)[os.path.basename(dot_file)] = current_hash
+        for engine in engines:
+            for fmt in formats:
+                output_file = get_output_file(output_path_base, engine, fmt)
+                if unchanged(output_file, current_hash):
+                    statuses[output_file] = 'unchanged'
+                else:
+                    tasks.append((dot_source, output_file, engine, fmt,
+                        current_hash))
+
+    def run_task(task):
+        dot_source, output_file, engine, fmt, _ = task
+        try:
+            layout(dot_source, output_file, engine, fmt, timeout)
+        except subprocess.TimeoutExpired:
+            return 'timed out'
+        except subprocess.CalledProcessError as error:
+            return 'failed: ' + error.stderr.decode('utf-8', 'replace') \
+                    .strip()
+        except OSError as error:
+            return 'failed: ' + str(error)
+        return 'rendered'
+
+    jobs = jobs or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for task, status in zip(tasks, executor.map(run_task, tasks)):
+            _, output_file, _, _, current_hash = task
+            statuses[output_file] = status
+            if status == 'rendered':
+                get_record(output_file)[os.path.basename(output_file)] = \
+                        current_hash
+
+    for record_path, record in records.items():
+        with open(record_path, 'w') as recordFile:
+            json.dump(record, recordFile, indent=4, sort_keys=True)
+    return statuses
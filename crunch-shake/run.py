@@ -1,35 +1,43 @@
+import argparse
+import glob
+import json
+import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from utils import (file_to_list, json_file_to_dict, to_json, list_to_file,
-        get_title)
+from utils import file_to_list, json_file_to_dict, to_json, get_title
 from mit_shakespeare_regex import matcher
 from parse import preprocess
-from process import process
-from analysis import postprocess
+from cache import PARSER_MODULES, PARSER_VERSION
+from pipeline import Pipeline, Stage
+from table import PlayTable
+from render import render_graphs, ENGINES, FORMATS
+from instrument import recording, span, SINKS
 
-import networkx as nx
+# process (numpy), analysis (networkx, numpy and scipy) and playfile (numpy)
+# are imported where they are used, so that importing run is cheap for
+# commands that only parse, see cli.py
+
+# playfile.SUFFIX, without importing playfile
+PLAY_SUFFIX = '.play'
 
 # INPUT OUTPUT
 
 def to_output(parsed_play, output_path, output_path_base):
+    from playfile import write_play
     play_lines, graph = parsed_play
-    a = [ str(x) + "\n" for x in play_lines ]
     print("writing to", output_path)
-    list_to_file(a, output_path_base + '.out')
-    dot_graph = nx.nx_agraph.to_agraph(graph)
-    dot_graph.write(output_path_base + ".dot")
-    prog = ['dot', 'circo']
-    for p in prog:
-        dot_graph.layout(p)
-        dot_graph.draw(output_path_base + "_" + p + ".png")
+    write_play(output_path_base + PLAY_SUFFIX, play_lines)
+    render_graphs({ output_path_base : graph })
 
 def get_files(play_path, gender_path):
     play_lines_raw = file_to_list(play_path)
     try:
         gender = json_file_to_dict(gender_path)
     except FileNotFoundError:
-        print("require gender file")
+        print("require gender file", file=sys.stderr)
         gender = None
     return play_lines_raw, gender
 
@@ -40,7 +48,8 @@ def get_paths(play_path):
     gender_path = os.path.join(head_dir, 'gender', play_name + ".gender")
     output_path = os.path.join(head_dir, 'output')
     output_path_base = os.path.join(output_path, play_name)
-    return gender_path, output_path, output_path_base, play_name
+    cache_path = os.path.join(head_dir, 'cache')
+    return gender_path, output_path, output_path_base, play_name, cache_path
 
 # STATS
 
@@ -69,29 +78,260 @@ def gender_stats(speaking_characters, gender, play_stats):
 # PROCESSING
 
 
-def process_play(raw_play_lines, gender, play_stats):
-    speaking_characters, play_lines = preprocess(raw_play_lines, matcher)
+def parse_and_process(raw_play_lines, scene_jobs=None):
+    """ scene_jobs processes, if more than one, process the scenes in
+    parallel, see `process.process` """
+    from process import process
+    with span('preprocess'):
+        speaking_characters, play_lines = preprocess(raw_play_lines, matcher)
+    with span('play_table'):
+        play_lines = PlayTable(play_lines)
+    with span('process'):
+        adj, act_scene_start_end = process(speaking_characters, play_lines,
+                scene_jobs)
+    return speaking_characters, play_lines, adj, act_scene_start_end
+
+def gender_stats_stage(parsed_play, gender):
+    speaking_characters, _, _, act_scene_start_end = parsed_play
+    play_stats = dict()
     gender_stats(speaking_characters, gender, play_stats)
-    adj, act_scene_start_end = process(speaking_characters, play_lines)
     play_stats['scenes'] = len(act_scene_start_end)
+    return play_stats
+
+def postprocess_stage(parsed_play, gender, metrics_weight):
+    """ (graph, stats added by postprocess) """
+    from analysis import postprocess
+    speaking_characters, play_lines, adj, act_scene_start_end = parsed_play
+    play_stats = dict()
     graph = postprocess(play_lines, speaking_characters, adj, gender,
-            act_scene_start_end, play_stats)
+            act_scene_start_end, play_stats, metrics_weight)
+    return graph, play_stats
+
+ANALYSIS_MODULES = ['run', 'analysis', 'centrality', 'vocab', 'tokenizer',
+        'scenes', 'table', 'lines', 'utils', 'trie']
+
+def create_play_pipeline(cache_path=None, scene_jobs=None):
+    """ Pipeline, see pipeline.py, of a play from the sources html (its raw
+    lines), gender and metrics_weight. Parsing depends only on the html, so
+    changing the gender or metrics_weight only reruns the stages after it.
+    scene_jobs, see `parse_and_process`, does not change the output, so is
+    not a source.
+    """
+    return Pipeline({
+        'parse_and_process' : Stage(partial(parse_and_process,
+            scene_jobs=scene_jobs), ['html'],
+            PARSER_MODULES + ['table', 'run'], PARSER_VERSION),
+        'gender_stats' : Stage(gender_stats_stage,
+            ['parse_and_process', 'gender'], ['run']),
+        'postprocess' : Stage(postprocess_stage,
+            ['parse_and_process', 'gender', 'metrics_weight'],
+            ANALYSIS_MODULES),
+        }, cache_path)
+
+def run_play_pipeline(raw_play_lines, gender, play_stats, cache_path=None,
+        metrics_weight=None, scene_jobs=None):
+    """ Run every stage of the play's pipeline, see `create_play_pipeline`,
+    adding the stats of the play to play_stats, and return the output of
+    each stage.
+
+    If cache_path is given, the output of each stage is loaded from or
+    stored in the cache there, so only the stages depending on what changed
+    since the last run are rerun.
+
+    The time spent in each stage, and counters such as the number of lines
+    parsed, are added to play_stats under 'timings' and 'counters', see
+    instrument.py. Stages loaded from the cache have no timings, nor
+    counters. """
+    if metrics_weight is None:
+        from analysis import METRICS_WEIGHT as metrics_weight
+    with recording() as recorder:
+        outputs = create_play_pipeline(cache_path, scene_jobs).run(
+                {'html' : raw_play_lines, 'gender' : gender,
+                    'metrics_weight' : metrics_weight},
+                ['parse_and_process', 'gender_stats', 'postprocess'])
+    _, postprocess_stats = outputs['postprocess']
+    play_stats.update(outputs['gender_stats'])
+    play_stats.update(postprocess_stats)
+    play_stats.update(recorder.report())
+    return outputs
+
+def process_play(raw_play_lines, gender, play_stats, cache_path=None,
+        metrics_weight=None, scene_jobs=None):
+    """ (play_lines, graph) of the play, see `run_play_pipeline` """
+    outputs = run_play_pipeline(raw_play_lines, gender, play_stats,
+            cache_path, metrics_weight, scene_jobs)
+    _, play_lines, _, _ = outputs['parse_and_process']
+    graph, _ = outputs['postprocess']
     return play_lines, graph
 
 
-def run(play_path, stats):
-    gender_path, output_path, output_path_base, play_name = get_paths(play_path)
+def run(play_path, stats, use_cache=True, write_plays=False,
+        parquet_dir=None, scene_jobs=None):
+    """ Analyse a play, adding its stats to stats. If write_plays, the parsed
+    play is written to the output directory as a play file, see playfile.py.
+    If parquet_dir is given, the play's lines, edges and stats are written
+    into it as Parquet, see columnar.py. scene_jobs processes, if more than
+    one, process the scenes of the play in parallel. """
+    gender_path, output_path, output_path_base, play_name, cache_path = \
+            get_paths(play_path)
     # print(play_name)
     raw_play_lines, gender = get_files(play_path, gender_path)
     stats[play_name] = {'title' : get_title(raw_play_lines)}
     play_stats= stats[play_name]
-    output = process_play(raw_play_lines, gender, play_stats)
+    output = process_play(raw_play_lines, gender, play_stats,
+            cache_path if use_cache else None, scene_jobs=scene_jobs)
     # to_output(output, output_path, output_path_base)
+    play_lines, graph = output
+    if write_plays:
+        from playfile import write_play
+        os.makedirs(output_path, exist_ok=True)
+        write_play(output_path_base + PLAY_SUFFIX, play_lines,
+                play=play_name, title=play_stats['title'])
+    if parquet_dir is not None:
+        from columnar import write_play_tables
+        write_play_tables(parquet_dir, play_name, play_lines, graph,
+                play_stats)
+    return output_path_base, graph
 
-def main():
-    play_path = os.path.abspath(sys.argv[1])
+def run_isolated(play_path, use_cache=True, write_plays=False,
+        parquet_dir=None, scene_jobs=None):
+    """ run with a fresh stats dict, which is returned along with the output
+    path base and graph of the play, so that it can be used as a task in a
+    process pool """
+    stats = {}
+    output_path_base, graph = run(play_path, stats, use_cache, write_plays,
+            parquet_dir, scene_jobs)
+    return stats, output_path_base, graph
+
+def run_corpus(play_paths, jobs=None, use_cache=True, write_plays=False,
+        parquet_dir=None, scene_jobs=None):
+    """ run every play, each as a separate task over a pool of jobs processes
+    (by default one per cpu), and merge their stats.
+
+    Returns
+    -------
+    stats : dict
+        play_name -> play_stats, in the order of play_paths
+    graphs : dict
+        output path base -> graph of each play, see `render.render_graphs`
+
+    Raises
+    ------
+    ValueError
+        if two plays have the same name, as their stats and output would
+        overwrite each other
+    """
+    play_names = dict()
+    for play_path in play_paths:
+        play_name = get_paths(play_path)[3]
+        if play_names.setdefault(play_name, play_path) != play_path:
+            raise ValueError("{0} and {1} are both named {2}".format(
+                play_names[play_name], play_path, play_name))
     stats = {}
-    run(play_path, stats)
+    graphs = {}
+    if jobs == 1 or len(play_paths) < 2:
+        for play_path in play_paths:
+            output_path_base, graph = run(play_path, stats, use_cache,
+                    write_plays, parquet_dir, scene_jobs)
+            graphs[output_path_base] = graph
+        return stats, graphs
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for play_stats, output_path_base, graph in executor.map(
+                partial(run_isolated, use_cache=use_cache,
+                    write_plays=write_plays, parquet_dir=parquet_dir,
+                    scene_jobs=scene_jobs),
+                play_paths):
+            stats.update(play_stats)
+            graphs[output_path_base] = graph
+    return stats, graphs
+
+def expand_play_paths(paths):
+    """ Each path can be a play, a directory of plays or a glob """
+    play_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            play_paths.extend(sorted(glob.glob(os.path.join(path, '*.html'))))
+        elif any(char in path for char in '*?['):
+            play_paths.extend(sorted(glob.glob(path)))
+        else:
+            play_paths.append(path)
+    # each play once, even if given more than once
+    return list(dict.fromkeys( os.path.abspath(play_path) for play_path in
+        play_paths ))
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Analyse plays")
+    parser.add_argument('plays', nargs='+',
+            help="play html files, directories of them, or globs such as "
+            "'plays/*.html'")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help="number of worker processes, defaults to the number of cpus")
+    parser.add_argument('--scene-jobs', type=int, default=None,
+            help="number of worker processes to process the scenes of each "
+            "play with, at most one per cpu, which only helps very long "
+            "plays, such as several concatenated, see process.process")
+    parser.add_argument('--stats', default=None,
+            help="write the stats of all the plays to this json file, "
+            "instead of printing them")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+            help="always parse the plays, instead of loading them from the "
+            "cache of parsed plays")
+    parser.add_argument('--trace-sink', choices=list(SINKS), default='none',
+            help="also pass the timings and counters of each play to a sink: "
+            "none, the log, or a json lines file (see --trace-file)")
+    parser.add_argument('--trace-file', default='trace.jsonl',
+            help="file the json sink appends to")
+    parser.add_argument('--write-plays', action='store_true',
+            help="write each parsed play to the output directory as a play "
+            "file, which playfile.read_play loads back")
+    parser.add_argument('--database', default=None,
+            help="also export the plays and their stats to this SQLite "
+            "database, see database.py")
+    parser.add_argument('--parquet', default=None,
+            help="also write the lines, edges and stats of each play as "
+            "Parquet into this directory, see columnar.py (needs pyarrow)")
+    parser.add_argument('--render', action='store_true',
+            help="draw the graph of each play into the output directory, "
+            "skipping graphs unchanged since they were last drawn")
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES),
+            help="Graphviz layout engines to render with")
+    parser.add_argument('--formats', nargs='+', default=['png'],
+            help="Graphviz output formats, e.g. " + " ".join(FORMATS))
+    parser.add_argument('--timeout', type=float, default=60,
+            help="seconds after which a single layout is abandoned")
+    parser.add_argument('--force-render', action='store_true',
+            help="render even unchanged graphs")
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    play_paths = expand_play_paths(args.plays)
+    if args.parquet:
+        # fail before running anything if pyarrow is missing
+        import columnar
+    stats, graphs = run_corpus(play_paths, args.jobs, args.use_cache,
+            args.write_plays, args.parquet, args.scene_jobs)
+    if args.trace_sink == 'log':
+        logging.basicConfig(level=logging.INFO)
+    sink = SINKS[args.trace_sink](args.trace_file)
+    for play_name, play_stats in stats.items():
+        sink(play_name, {'timings' : play_stats['timings'],
+            'counters' : play_stats['counters']})
+    if args.render:
+        for output_path_base in graphs:
+            os.makedirs(os.path.dirname(output_path_base), exist_ok=True)
+        statuses = render_graphs(graphs, args.engines, args.formats,
+                args.jobs, args.timeout, args.force_render)
+        for output_file in sorted(statuses):
+            if statuses[output_file] != 'unchanged':
+                print(output_file, statuses[output_file])
+    if args.database:
+        from database import export_corpus
+        export_corpus(play_paths, args.database, stats, args.use_cache)
+    if args.stats:
+        to_json(stats, args.stats)
+    else:
+        print(json.dumps(stats, indent=4))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+import numpy as np
+
+"""
+SCENE INDEX
+===========
+
+Buckets line numbers of a play into its scenes by binary search over the
+scene boundaries, so that any per line list (Bechdel lines, vocabulary hits,
+presence records, ...) can be split by scene in O(n log s) for n lines and s
+scenes. Build one per play and share it between passes.
+"""
+
+class SceneIndex:
+    """ Parameters
+    ----------
+    act_scene_start_end : list of tuples
+        (start, end) line range of each scene, contiguous and in order, as
+        returned by `process.process`
+
+    Attributes
+    ----------
+    starts : numpy array
+        first line of each scene
+    ends : numpy array
+        line after the last of each scene
+    """
+    def __init__(self, act_scene_start_end):
+        self.act_scene_start_end = act_scene_start_end
+        self.starts = np.array([ start for start, _ in act_scene_start_end ],
+                dtype=np.int64)
+        self.ends = np.array([ end for _, end in act_scene_start_end ],
+                dtype=np.int64)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def ranges(self, sorted_lines):
+        """ For each scene, the (inclusive, exclusive) range of indices of
+        sorted_lines which belong to that scene.
+
+        For example:
+        >>> sorted_lines = [0, 1, 3, 8, 9, 10, 11, 100, 101]
+        >>> SceneIndex([(0, 10), (10, 30), (30, 80), (80, 102)]).ranges(
+                sorted_lines)
+        [(0, 5), (5, 7), (7, 7), (7, 9)]
+        """
+        cuts = np.searchsorted(sorted_lines, self.ends).tolist()
+        return list(zip([0] + cuts[:-1], cuts))
+
+    def scene_of(self, lines):
+        """ Index of the scene of each line number in lines, which need not be
+        sorted, but must be within the play """
+        return np.searchsorted(self.starts, lines, side='right') - 1
+
+    def split(self, lines):
+        """ Split lines, which need not be sorted, into a list with the lines
+        of each scene, keeping their order within each scene """
+        lines = np.asarray(lines, dtype=np.int64)
+        scenes = self.scene_of(lines)
+        order = np.argsort(scenes, kind='stable')
+        counts = np.bincount(scenes, minlength=len(self))
+        return np.split(lines[order], np.cumsum(counts)[:-1])
@@ -0,0 +1,335 @@
+import argparse
+import os
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from lines import Dialogue
+from tokenizer import create_tokenizer, PLAIN_WORD_PATTERN
+from run import expand_play_paths, get_paths, get_files, create_play_pipeline
+
+"""
+DIALOGUE SEARCH
+===============
+
+Positional inverted index over the dialogue of any number of plays, for
+questions such as "where does HAMLET say 'mother'" or "which scenes mention
+ROMEO", without scanning the dialogue again.
+
+Every occurrence of a word is stored as (term, line, position), sorted by
+term, so the occurrences of a term are a single slice. Lines are numbered
+across the whole index, and each has its play, index in play_lines,
+character, act and scene. Phrases are found by matching the positions of
+their words, and queries combine phrases with and, or and not, filtered by
+play, character, gender or scene range.
+
+Words are split at apostrophes and case folded, as in
+`analysis.create_forbidden_tagger`, so that a phrase is found in the same
+lines as the Bechdel test finds it.
+
+The index is built from the output of the parse_and_process stage of each
+play's pipeline, see `run.create_play_pipeline`, so plays already run are
+loaded from the cache rather than parsed again.
+"""
+
+Hit = namedtuple('Hit', ['play', 'line', 'character', 'act', 'scene'])
+Hit.__doc__ = """ A line of dialogue matching a query, line being its index
+    in the play's play_lines """
+
+class DialogueIndex:
+    """ Parameters
+    ----------
+    tokenize : function, optional
+        splits dialogue into words, by default
+        `tokenizer.create_tokenizer(PLAIN_WORD_PATTERN)`
+
+    Attributes
+    ----------
+    terms : list of str
+    term_id : dict
+    plays : list of str
+    play_id : dict
+        index of each play in plays
+    characters : list of tuples
+        (play index, character name)
+    genders : list of str
+        gender letter of each character, None if not known
+    line_plays, line_indices, line_characters, line_acts, line_scenes : array
+        play, index in play_lines, character, act and scene of each line
+    """
+    def __init__(self, tokenize=None):
+        self.tokenize = tokenize or create_tokenizer(PLAIN_WORD_PATTERN)
+        self.terms = []
+        self.term_id = dict()
+        self.plays = []
+        self.play_id = dict()
+        self.characters = []
+        self.character_id = dict()
+        self.genders = []
+        self.line_plays = array('q')
+        self.line_indices = array('q')
+        self.line_characters = array('q')
+        self.line_acts = array('q')
+        self.line_scenes = array('q')
+        # occurrences as added
+        self._terms = array('q')
+        self._lines = array('q')
+        self._positions = array('q')
+        self._postings = None
+
+    def add_play(self, play_name, play_lines, gender=None):
+        """ Index every line of dialogue of play_lines """
+        play = len(self.plays)
+        self.play_id[play_name] = play
+        self.plays.append(play_name)
+        term_id = self.term_id
+        for i, line in enumerate(play_lines):
+            if line.TYPE != Dialogue.TYPE:
+                continue
+            if (play, line.character) not in self.character_id:
+                self.character_id[(play, line.character)] = len(
+                        self.characters)
+                self.characters.append((play, line.character))
+                self.genders.append(gender.get(line.character)
+                        if gender else None)
+            line_id = len(self.line_plays)
+            self.line_plays.append(play)
+            self.line_indices.append(i)
+            self.line_characters.append(
+                    self.character_id[(play, line.character)])
+            self.line_acts.append(int(line.act))
+            self.line_scenes.append(int(line.scene))
+            for position, word in enumerate(self.tokenize(line.dialogue)):
+                if word not in term_id:
+                    term_id[word] = len(self.terms)
+                    self.terms.append(word)
+                self._terms.append(term_id[word])
+                self._lines.append(line_id)
+                self._positions.append(position)
+        self._postings = None
+
+    @property
+    def postings(self):
+        """ (term_offsets, lines, positions, stride), the occurrences of term
+        t being lines[term_offsets[t]:term_offsets[t + 1]], and stride more
+        than any position """
+        if self._postings is None:
+            terms = np.array(self._terms, dtype=np.int64)
+            lines = np.array(self._lines, dtype=np.int64)
+            positions = np.array(self._positions, dtype=np.int64)
+            order = np.lexsort((positions, lines, terms))
+            term_offsets = np.concatenate(([0], np.cumsum(np.bincount(
+                terms, minlength=len(self.terms)))))
+            stride = int(positions.max(initial=0)) + 1
+            self._postings = (term_offsets, lines[order], positions[order],
+                    stride)
+        return self._postings
+
+    def occurrences(self, word):
+        """ (lines, positions) of every occurrence of word, which must
+        already be tokenized """
+        term_offsets, lines, positions, _ = self.postings
+        if word not in self.term_id:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        t = self.term_id[word]
+        start, end = term_offsets[t], term_offsets[t + 1]
+        return lines[start:end], positions[start:end]
+
+    def phrase_lines(self, phrase):
+        """ Sorted lines containing the words of phrase in a row, within a
+        single line
+
+        >>> index = DialogueIndex()
+        >>> index.add_play('play', [
+        ...     Dialogue('alpha beta gamma', None, 'A', 1, 1),
+        ...     Dialogue('delta epsilon', None, 'B', 1, 1)])
+        >>> index.phrase_lines('beta gamma').tolist()
+        [0]
+        >>> index.phrase_lines('gamma delta').tolist()
+        []
+        """
+        words = self.tokenize(phrase)
+        if not words:
+            return np.zeros(0, dtype=np.int64)
+        lines, positions = self.occurrences(words[0])
+        # line and position as a single number, which is only unique for
+        # positions less than stride
+        stride = self.postings[3]
+        for offset, word in enumerate(words[1:], 1):
+            next_lines, next_positions = self.occurrences(word)
+            found = (positions + offset < stride) & np.isin(
+                    lines * stride + positions + offset,
+                    next_lines * stride + next_positions)
+            lines, positions = lines[found], positions[found]
+        return np.unique(lines)
+
+    def select(self, play=None, character=None, gender=None, scenes=None):
+        """ Boolean mask of the lines matching every given filter.
+
+        Parameters
+        ----------
+        character : str or list of str
+        scenes : tuple
+            ((act, scene), (act, scene)), the first and last scene of the
+            range
+
+        Raises
+        ------
+        ValueError
+            if play is not in the index
+        """
+        line_plays = np.frombuffer(self.line_plays, dtype=np.int64)
+        mask = np.ones(len(line_plays), dtype=bool)
+        if play is not None:
+            if play not in self.play_id:
+                raise ValueError("unknown play " + play)
+            mask &= line_plays == self.play_id[play]
+        if character is not None or gender is not None:
+            characters = np.ones(len(self.characters), dtype=bool)
+            if character is not None:
+                names = { character } if isinstance(character, str) \
+                        else set(character)
+                characters &= np.array([ name in names for _, name in
+                    self.characters ], dtype=bool)
+            if gender is not None:
+                characters &= np.array(self.genders) == gender
+            mask &= characters[np.frombuffer(self.line_characters,
+                dtype=np.int64)]
+        if scenes is not None:
+            (first_act, first_scene), (last_act, last_scene) = scenes
+            act_scene = np.frombuffer(self.line_acts, dtype=np.int64) \
+                    * 1000 + np.frombuffer(self.line_scenes, dtype=np.int64)
+            mask &= (act_scene >= first_act * 1000 + first_scene) \
+                    & (act_scene <= last_act * 1000 + last_scene)
+        return mask
+
+    def find(self, all_of=(), any_of=(), none_of=(), **filters):
+        """ Sorted lines containing every phrase of all_of, and at least one
+        of any_of (if given), and none of none_of, filtered by `select`.
+
+        For example, where HAMLET says 'mother' is
+        index.find(['mother'], play='hamlet', character='HAMLET')
+        """
+        mask = self.select(**filters)
+        for phrase in all_of:
+            found = np.zeros(len(mask), dtype=bool)
+            found[self.phrase_lines(phrase)] = True
+            mask &= found
+        if any_of:
+            found = np.zeros(len(mask), dtype=bool)
+            for phrase in any_of:
+                found[self.phrase_lines(phrase)] = True
+            mask &= found
+        for phrase in none_of:
+            mask[self.phrase_lines(phrase)] = False
+        return np.flatnonzero(mask)
+
+    def search(self, all_of=(), any_of=(), none_of=(), **filters):
+        """ Hit of each line found by `find` """
+        return [ Hit(self.plays[self.line_plays[line]],
+            self.line_indices[line],
+            self.characters[self.line_characters[line]][1],
+            self.line_acts[line], self.line_scenes[line])
+            for line in self.find(all_of, any_of, none_of,
+                **filters).tolist() ]
+
+    def save(self, path):
+        term_offsets, lines, positions, _ = self.postings
+        np.savez_compressed(path,
+                terms=np.array(self.terms, dtype=str),
+                plays=np.array(self.plays, dtype=str),
+                character_plays=np.array([ p for p, _ in self.characters ],
+                    dtype=int),
+                character_names=np.array([ c for _, c in self.characters ],
+                    dtype=str),
+                genders=np.array([ g or '' for g in self.genders ],
+                    dtype=str),
+                line_plays=self.line_plays, line_indices=self.line_indices,
+                line_characters=self.line_characters,
+                line_acts=self.line_acts, line_scenes=self.line_scenes,
+                term_offsets=term_offsets, lines=lines, positions=positions)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with np.load(path) as saved:
+            index.terms = saved['terms'].tolist()
+            index.term_id = { term : i for i, term in enumerate(index.terms) }
+            index.plays = saved['plays'].tolist()
+            index.play_id = { play : i for i, play in enumerate(index.plays) }
+            index.characters = list(zip(saved['character_plays'].tolist(),
+                saved['character_names'].tolist()))
+            index.character_id = { character : i for i, character in
+                    enumerate(index.characters) }
+            index.genders = [ g or None for g in saved['genders'].tolist() ]
+            for name in ['line_plays', 'line_indices', 'line_characters',
+                    'line_acts', 'line_scenes']:
+                setattr(index, name, array('q', saved[name].tolist()))
+            term_offsets = saved['term_offsets']
+            lines, positions = saved['lines'], saved['positions']
+        # back to occurrences as added, so that more plays can be added
+        index._terms = array('q', np.repeat(np.arange(len(index.terms)),
+            np.diff(term_offsets)).tolist())
+        index._lines = array('q', lines.tolist())
+        index._positions = array('q', positions.tolist())
+        index._postings = (term_offsets, lines, positions,
+                int(positions.max(initial=0)) + 1)
+        return index
+
+def build_index(play_paths, use_cache=True):
+    """ DialogueIndex of every play in play_paths, from the parse_and_process
+    stage of its pipeline, loaded from the cache if use_cache and the play
+    has already been run. Gender is read from the play's gender file, if it
+    has one. """
+    index = DialogueIndex()
+    for play_path in play_paths:
+        gender_path, _, _, play_name, cache_path = get_paths(play_path)
+        raw_play_lines, gender = get_files(play_path, gender_path)
+        _, play_lines, _, _ = create_play_pipeline(
+                cache_path if use_cache else None).run(
+                        {'html' : raw_play_lines}, ['parse_and_process']
+                        )['parse_and_process']
+        index.add_play(play_name, play_lines, gender)
+    return index
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description="Search the dialogue of the corpus")
+    parser.add_argument('phrases', nargs='*',
+            help="phrases every line found must contain")
+    parser.add_argument('--any', nargs='+', default=(),
+            help="phrases of which lines found must contain at least one")
+    parser.add_argument('--none', nargs='+', default=(),
+            help="phrases lines found must not contain")
+    parser.add_argument('--play', default=None)
+    parser.add_argument('--character', default=None)
+    parser.add_argument('--gender', default=None)
+    parser.add_argument('--index', default='search.npz',
+            help="index file, built if it does not exist")
+    parser.add_argument('--plays', default='plays/*.html',
+            help="glob of the plays to build the index from")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+            help="always parse the plays, instead of loading them from the "
+            "cache of parsed plays")
+    return parser
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if os.path.exists(args.index):
+        index = DialogueIndex.load(args.index)
+    else:
+        index = build_index(expand_play_paths([args.plays]), args.use_cache)
+        index.save(args.index)
+    if args.play is not None and args.play not in index.play_id:
+        parser.error("unknown play " + args.play)
+    for hit in index.search(args.phrases, args.any, args.none,
+            play=args.play, character=args.character, gender=args.gender):
+        print("{0} {1}.{2} {3} (line {4})".format(hit.play, hit.act,
+            hit.scene, hit.character, hit.line))
+
+
+if __name__ == "__main__":
+    main()
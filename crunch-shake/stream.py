@@ -0,0 +1,191 @@
+import argparse
+import json
+import sys
+from collections import namedtuple
+
+from utils import get_matcher, json_file_to_dict
+from mit_shakespeare_regex import matcher
+from lines import Character, Act, Scene
+from parse import tokenize, resolve_instruction
+from process import get_presence, entrance_exit_by_scene
+from analysis import bechdel_test, create_forbidden_tagger, GENDER_PREFIX
+from scenes import SceneIndex
+
+"""
+STREAMING PIPELINE
+==================
+
+Processes a play a scene at a time, so that only the scene being processed is
+held in memory rather than the whole play. This allows arbitrarily long input,
+such as many plays concatenated, or a play piped through stdin.
+
+As the whole play is never seen, a few things differ from `run.py`.
+
+1. Names in a stage direction are resolved against the characters known when
+its scene closes, i.e. those given up front (the keys of the gender file) and
+those who have spoken so far.
+
+2. The Bechdel test needs the notable characters of each gender, which
+`analysis.get_notable_characters` ranks using the whole play. Instead the
+notable characters are given up front, by default every character of that
+gender.
+"""
+
+SceneResult = namedtuple('SceneResult', ['act', 'scene', 'start', 'lines',
+    'adj', 'bechdel'])
+SceneResult.__doc__ = """ Parameters
+    ----------
+    act : int
+    scene : int
+    start : int
+        index of the first line of the scene, counting from the start of the
+        input
+    lines : list of namedtuple
+        parsed lines of the scene
+    adj : dict
+        as returned by `process.get_presence`, but only for this scene, with
+        line numbers counting from the start of the input
+    bechdel : dict
+        maps gender letter to whether the scene passes the Bechdel test for
+        that gender
+    """
+
+def read_lines(path):
+    """ Lazily yield the lines of the file at path, or of stdin if path is
+    '-' """
+    if path == '-':
+        yield from sys.stdin
+        return
+    with open(path, 'r') as inputFile:
+        yield from inputFile
+
+def iter_scenes(raw_play_lines, matcher, known_characters=()):
+    """ Yield (start, scene_lines, speaking_characters) as each scene closes,
+    where scene_lines are the parsed lines of the scene starting at line
+    start of the play, and speaking_characters are all the characters who
+    have spoken so far (and includes known_characters).
+
+    A scene starts with its scene line, or the act line before it, as in
+    `process.get_act_scene_range`. Any lines before the first scene are part
+    of it.
+    """
+    speaking_characters = set(known_characters)
+    known_characters_matcher = get_matcher(speaking_characters, "character")
+    matched_characters = len(speaking_characters)
+    start = 0
+    tokens = []
+    has_scene = False
+
+    def close_scene(tokens):
+        nonlocal known_characters_matcher, matched_characters
+        if len(speaking_characters) != matched_characters:
+            known_characters_matcher = get_matcher(speaking_characters,
+                    "character")
+            matched_characters = len(speaking_characters)
+        return [ resolve_instruction(line, raw_instruction,
+            default_character, known_characters_matcher, matcher.instruction)
+            for line, raw_instruction, default_character in tokens ]
+
+    for token in tokenize(raw_play_lines, matcher):
+        line = token[0]
+        if line is not None and line.TYPE == Scene.TYPE and has_scene:
+            carried = []
+            if tokens[-1][0] is not None and tokens[-1][0].TYPE == Act.TYPE:
+                carried = [tokens.pop()]
+            yield start, close_scene(tokens), speaking_characters
+            start += len(tokens)
+            tokens = carried
+        if line is not None:
+            if line.TYPE == Scene.TYPE:
+                has_scene = True
+            elif line.TYPE == Character.TYPE:
+                speaking_characters.add(line.character)
+        tokens.append(token)
+    if tokens:
+        yield start, close_scene(tokens), speaking_characters
+
+def process_scene(scene_lines, speaking_characters):
+    """ adj for a single scene, see `process.get_presence`, leaving out
+    characters who do not speak in it """
+    scene_start_end = [(0, len(scene_lines))]
+    entrance, exit = entrance_exit_by_scene(scene_lines, 0, len(scene_lines))
+    adj = get_presence(speaking_characters, scene_lines, scene_start_end,
+            [entrance], [exit])
+    return { speaker : adj[speaker] for speaker in adj if adj[speaker] }
+
+def create_bechdel_scene(gender, notable=None):
+    """ Returns bechdel_scene(scene_lines, adj) which tests a single scene for
+    each gender letter, with adj as returned by `process_scene`.
+
+    notable maps a gender letter to its notable characters, by default every
+    character of that gender.
+    """
+    if notable is None:
+        notable = { letter : { character for character in gender
+            if gender[character] == letter } for letter in GENDER_PREFIX }
+    tag = create_forbidden_tagger(gender, gender, notable)
+
+    def bechdel_scene(scene_lines, adj):
+        scene_index = SceneIndex([(0, len(scene_lines))])
+        scene_notable = { letter : notable[letter] & adj.keys()
+                for letter in notable }
+        bechdel = bechdel_test(scene_lines, scene_notable, tag, adj,
+                scene_index, dict())
+        return { letter : bechdel[letter][0][0] for letter in bechdel }
+    return bechdel_scene
+
+def get_act_scene(scene_lines, act):
+    """ (act, scene) of scene_lines, act is the current act if the scene does
+    not start with an act line """
+    for line in scene_lines:
+        if line.TYPE == Act.TYPE:
+            act = line.act
+        elif line.TYPE == Scene.TYPE:
+            return act, line.scene
+    return act, None
+
+def stream_play(raw_play_lines, matcher, gender=None, notable=None):
+    """ Yield a SceneResult as each scene of the play closes.
+
+    If gender is None the Bechdel test is skipped (and bechdel is an empty
+    dict), else gender names are known from the start, see `iter_scenes`.
+    """
+    known_characters = gender.keys() if gender else ()
+    bechdel_scene = create_bechdel_scene(gender, notable) if gender else None
+    act = 1
+    for start, scene_lines, speaking_characters in iter_scenes(
+            raw_play_lines, matcher, known_characters):
+        act, scene = get_act_scene(scene_lines, act)
+        adj = process_scene(scene_lines, speaking_characters)
+        bechdel = bechdel_scene(scene_lines, adj) if bechdel_scene else {}
+        shifted_adj = { speaker : { spoken : [ i + start for i in
+            adj[speaker][spoken] ] for spoken in adj[speaker] }
+            for speaker in adj }
+        yield SceneResult(act, scene, start, scene_lines, shifted_adj,
+                bechdel)
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description="Analyse a play a scene at a time")
+    parser.add_argument('play', help="play html file, or - for stdin")
+    parser.add_argument('--gender', default=None,
+            help="gender file, needed for the Bechdel test")
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    gender = json_file_to_dict(args.gender) if args.gender else None
+    for result in stream_play(read_lines(args.play), matcher, gender):
+        print(json.dumps({
+            'act' : result.act,
+            'scene' : result.scene,
+            'start' : result.start,
+            'lines' : len(result.lines),
+            'presence' : { speaker : { spoken : len(lines) for spoken, lines
+                in result.adj[speaker].items() } for speaker in result.adj },
+            'bechdel' : result.bechdel,
+            }))
+
+
+if __name__ == "__main__":
+    main()
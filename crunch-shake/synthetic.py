@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import random
+
+from lookup import ROMAN_TO_INT
+
+"""
+SYNTHETIC PLAYS
+===============
+
+Generates plays in the html of the MIT website, as matched by
+mit_shakespeare_regex.py, of any size, to test how the pipeline scales beyond
+Shakespeare (Hamlet, the longest play, has around 9k lines).
+
+Each scene opens with a crowd of characters entering. Those on stage take
+turns to speak a few lines each, now and then naming another character, and
+stage directions, at the given density, send characters off and bring others
+on, or mark a line as an aside. Everyone leaves at the end of the scene.
+
+Act and scene numbers are roman numerals, and the parser only knows up to XV
+(see lookup.py), so a play has at most MAX_NUMERAL acts of MAX_NUMERAL
+scenes.
+"""
+
+MAX_NUMERAL = 15
+INT_TO_NUMERAL = { value : numeral for numeral, value in
+        ROMAN_TO_INT.items() if value <= MAX_NUMERAL }
+
+SYLLABLES = ['al', 'ber', 'cor', 'dan', 'el', 'fen', 'gar', 'hel', 'is',
+        'jul', 'ka', 'lor', 'mar', 'nor', 'os', 'per', 'quin', 'ros', 'sil',
+        'tor', 'ul', 'val', 'wil', 'xan', 'yor', 'zen']
+
+WORDS = """
+the and of to my you that in is not with it for his be your this but he
+have as thou so him will what thy all her no by do shall if are we thee our
+on lord good now sir love o me they well from let more was would heaven
+death night king day hand eye speak heart come know make man blood time
+""".split()
+
+GENDERS = [('F', 0.4), ('M', 0.55), ('N', 0.05)]
+
+def get_name(i):
+    """ Unique name of the ith character, from SYLLABLES """
+    syllables = []
+    i += len(SYLLABLES)
+    while i:
+        i, j = divmod(i, len(SYLLABLES))
+        syllables.append(SYLLABLES[j])
+    return ''.join(reversed(syllables)).upper()
+
+def join_names(names):
+    if len(names) == 1:
+        return names[0]
+    return ", ".join(names[:-1]) + " and " + names[-1]
+
+def generate_play(cast_size=30, scenes=20, lines_per_scene=200,
+        direction_density=0.05, crowd_size=6, seed=0, title="Synthetic"):
+    """
+    Parameters
+    ----------
+    cast_size : int
+        number of characters
+    scenes : int
+        number of scenes, spread evenly over as few acts as possible
+    lines_per_scene : int
+        lines of dialogue in each scene
+    direction_density : float
+        chance of a stage direction after each line of dialogue
+    crowd_size : int
+        number of characters on stage at once
+
+    Returns
+    -------
+    raw_play_lines : list of str
+        html of the play, a line per item
+    gender : dict
+        maps each character to their gender letter, as in the gender files
+    """
+    acts = -(-scenes // MAX_NUMERAL)
+    if acts > MAX_NUMERAL:
+        raise ValueError("at most {0} scenes".format(MAX_NUMERAL ** 2))
+    crowd_size = max(1, min(crowd_size, cast_size))
+    rng = random.Random(seed)
+    cast = [ get_name(i) for i in range(cast_size) ]
+    letters, weights = zip(*GENDERS)
+    gender = { name : rng.choices(letters, weights)[0] for name in cast }
+
+    html = [
+        '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0 Transitional//EN">\n',
+        '<html>\n',
+        '<head>\n',
+        '<title>{0}: Entire Play\n'.format(title),
+        '</title>\n',
+        '</head>\n',
+        '<body>\n',
+        ]
+    speech = 0
+    scenes_per_act = -(-scenes // acts) if scenes else 0
+    for scene_number in range(scenes):
+        act, scene = divmod(scene_number, scenes_per_act)
+        act, scene = act + 1, scene + 1
+        if scene == 1:
+            html.append('<h3>ACT {0}</h3>\n'.format(INT_TO_NUMERAL[act]))
+        html.append('<h3>SCENE {0}. A room.</h3>\n'.format(
+            INT_TO_NUMERAL[scene]))
+        on_stage = rng.sample(cast, crowd_size)
+        html.append('<p><blockquote>\n')
+        html.append('<i>Enter {0}</i>\n'.format(join_names(on_stage)))
+        html.append('</blockquote>\n')
+        line = 0
+        while line < lines_per_scene:
+            speaker = rng.choice(on_stage)
+            speech += 1
+            html.append('\n')
+            html.append('<A NAME=speech{0}><b>{1}</b></a>\n'.format(speech,
+                speaker))
+            html.append('<blockquote>\n')
+            direction = None
+            for _ in range(min(rng.randint(1, 4), lines_per_scene - line)):
+                line += 1
+                words = rng.choices(WORDS, k=rng.randint(4, 9))
+                if rng.random() < 0.1:
+                    words.insert(rng.randrange(len(words)),
+                            rng.choice(cast).capitalize())
+                aside = ''
+                if rng.random() < direction_density:
+                    if rng.random() < 0.3:
+                        aside = '[Aside]  '
+                    else:
+                        direction = rng.random()
+                words[0] = words[0].capitalize()
+                html.append('<A NAME={0}.{1}.{2}>{3}{4}</A><br>\n'.format(
+                    act, scene, line, aside, ' '.join(words)))
+            if direction is not None:
+                off_stage = [ name for name in cast if name not in on_stage ]
+                if direction < 0.5 and len(on_stage) > 1:
+                    leaving = rng.choice(on_stage)
+                    on_stage.remove(leaving)
+                    html.append('<p><i>Exit {0}</i></p>\n'.format(leaving))
+                elif off_stage:
+                    entering = rng.choice(off_stage)
+                    on_stage.append(entering)
+                    html.append('<p><i>Enter {0}</i></p>\n'.format(entering))
+                if len(on_stage) > crowd_size and len(on_stage) > 1:
+                    leaving = rng.choice(on_stage)
+                    on_stage.remove(leaving)
+                    html.append('<p><i>Exit {0}</i></p>\n'.format(leaving))
+            html.append('</blockquote>\n')
+        html.append('<p><i>Exeunt</i></p>\n')
+    html.append('</body>\n')
+    html.append('</html>\n')
+    return html, gender
+
+def write_synthetic_play(head_dir, name, **parameters):
+    """ Write a play generated with parameters, see `generate_play`, to
+    head_dir/plays/name.html and its gender file to
+    head_dir/gender/name.gender, where `run.py` looks for them. Returns the
+    path of the play. """
+    raw_play_lines, gender = generate_play(**parameters)
+    play_path = os.path.join(head_dir, 'plays', name + '.html')
+    os.makedirs(os.path.dirname(play_path), exist_ok=True)
+    os.makedirs(os.path.join(head_dir, 'gender'), exist_ok=True)
+    with open(play_path, 'w') as outputFile:
+        outputFile.writelines(raw_play_lines)
+    with open(os.path.join(head_dir, 'gender', name + '.gender'),
+            'w') as genderFile:
+        json.dump(gender, genderFile, indent=4)
+    return play_path
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Generate a synthetic play")
+    parser.add_argument('name', help="name of the play")
+    parser.add_argument('--dir', default='.',
+            help="directory to write plays/name.html and gender/name.gender "
+            "into")
+    parser.add_argument('--cast', type=int, default=30)
+    parser.add_argument('--scenes', type=int, default=20)
+    parser.add_argument('--lines', type=int, default=200,
+            help="lines of dialogue per scene")
+    parser.add_argument('--directions', type=float, default=0.05,
+            help="chance of a stage direction after each line")
+    parser.add_argument('--crowd', type=int, default=6,
+            help="number of characters on stage at once")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    print(write_synthetic_play(args.dir, args.name, cast_size=args.cast,
+        scenes=args.scenes, lines_per_scene=args.lines,
+        direction_density=args.directions, crowd_size=args.crowd,
+        seed=args.seed, title=args.name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import sys
+from array import array
+
+from lines import Dialogue, Character, Instruction, Act, Scene
+
+"""
+PLAY TABLE
+==========
+
+Columnar alternative to a list of `lines` namedtuples. Rather than one tuple
+(and its strings) per line, a play is stored as a handful of arrays with one
+entry per line, text in a single shared string and instructions in a side
+table.
+
+Indexing or iterating a PlayTable gives back the namedtuples, so it can be
+passed wherever play_lines is expected, while passes that only need the type
+or speaker of a line can compare integers in `types` and `character_ids`.
+"""
+
+LINE_TYPES = [Dialogue, Character, Instruction, Act, Scene]
+DIALOGUE, CHARACTER, INSTRUCTION, ACT, SCENE = range(len(LINE_TYPES))
+TYPE_CODE = { line_type.TYPE : code for code, line_type in
+        enumerate(LINE_TYPES) }
+
+NO_ID = -1
+
+class PlayTable:
+    """ Parameters
+    ----------
+    play_lines : iterable of namedtuple
+        lines of the play, as returned by `parse.parse_raw_text`
+
+    Attributes
+    ----------
+    types : array of int
+        type code of each line, one of DIALOGUE, CHARACTER, INSTRUCTION, ACT
+        or SCENE
+    character_ids : array of int
+        index into `characters` of the character speaking (for dialogue) or
+        about to speak (for character lines), else NO_ID
+    characters : list of str
+        interned character names, in order of first appearance
+    acts : array of int
+        act each line is in, 0 before the first act
+    scenes : array of int
+        scene each line is in, 0 before the first scene
+    offsets : array of int
+        the dialogue of line i is text[offsets[i]:offsets[i + 1]]
+    text : str
+        dialogue of every line, concatenated
+    instruction_ids : array of int
+        index into `instructions` of the instruction line, or of the
+        instruction embedded in a line of dialogue, else NO_ID
+    instructions : list of Instruction
+    """
+    def __init__(self, play_lines):
+        self.types = array('b')
+        self.character_ids = array('i')
+        self.characters = []
+        self.acts = array('i')
+        self.scenes = array('i')
+        self.offsets = array('l', [0])
+        self.instruction_ids = array('i')
+        self.instructions = []
+        character_id = dict()
+        text = []
+        length = 0
+        act = scene = 0
+        for line in play_lines:
+            code = TYPE_CODE[line.TYPE]
+            character = None
+            instruction = None
+            dialogue = ''
+            if code == DIALOGUE:
+                character = line.character
+                instruction = line.instruction
+                dialogue = line.dialogue
+                act, scene = int(line.act), int(line.scene)
+            elif code == CHARACTER:
+                character = line.character
+            elif code == INSTRUCTION:
+                instruction = line
+            elif code == ACT:
+                act = line.act
+            elif code == SCENE:
+                scene = line.scene
+            self.types.append(code)
+            if character is None:
+                self.character_ids.append(NO_ID)
+            else:
+                if character not in character_id:
+                    character_id[character] = len(self.characters)
+                    self.characters.append(sys.intern(character))
+                self.character_ids.append(character_id[character])
+            self.acts.append(act)
+            self.scenes.append(scene)
+            text.append(dialogue)
+            length += len(dialogue)
+            self.offsets.append(length)
+            if instruction is None:
+                self.instruction_ids.append(NO_ID)
+            else:
+                self.instruction_ids.append(len(self.instructions))
+                self.instructions.append(instruction)
+        self.text = ''.join(text)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self.line(j) for j in range(*i.indices(len(self))) ]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('PlayTable index out of range')
+        return self.line(i)
+
+    def __iter__(self):
+        return ( self.line(i) for i in range(len(self)) )
+
+    def character(self, i):
+        character_id = self.character_ids[i]
+        return None if character_id == NO_ID else self.characters[character_id]
+
+    def dialogue(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def instruction(self, i):
+        instruction_id = self.instruction_ids[i]
+        return None if instruction_id == NO_ID \
+                else self.instructions[instruction_id]
+
+    def iter_dialogue(self):
+        """ (index, character, dialogue) of every line of dialogue, without
+        building the namedtuples """
+        characters, offsets, text = self.characters, self.offsets, self.text
+        for i, code in enumerate(self.types):
+            if code == DIALOGUE:
+                yield (i, characters[self.character_ids[i]],
+                        text[offsets[i]:offsets[i + 1]])
+
+    def line(self, i):
+        """ namedtuple view of line i """
+        code = self.types[i]
+        if code == DIALOGUE:
+            return Dialogue(self.dialogue(i), self.instruction(i),
+                    self.character(i), str(self.acts[i]),
+                    str(self.scenes[i]))
+        elif code == CHARACTER:
+            return Character(self.character(i))
+        elif code == INSTRUCTION:
+            return self.instruction(i)
+        elif code == ACT:
+            return Act(self.acts[i])
+        else:
+            return Scene(self.scenes[i])
+
+def as_table(play_lines):
+    """ play_lines as a PlayTable, built from them if they are not one """
+    if isinstance(play_lines, PlayTable):
+        return play_lines
+    return PlayTable(play_lines)
+
+def iter_dialogue(play_lines):
+    """ (index, character, dialogue) of every line of dialogue in play_lines,
+    which can be a PlayTable, a `playfile.PlayFile` or a list of namedtuples
+    """
+    if hasattr(play_lines, 'iter_dialogue'):
+        return play_lines.iter_dialogue()
+    return ( (i, line.character, line.dialogue) for i, line in
+            enumerate(play_lines) if line.TYPE == Dialogue.TYPE )
+
+def iter_rows(play_lines):
+    """ (index, type, character, act, scene, text) of every line of
+    play_lines, as flat rows for export. Act and scene are the numbers of
+    those the line is in, character the speaker (the default character of an
+    instruction) and text the dialogue or the raw instruction. """
+    act = scene = None
+    for i, line in enumerate(play_lines):
+        character = text = None
+        if line.TYPE == Act.TYPE:
+            act = int(line.act)
+        elif line.TYPE == Scene.TYPE:
+            scene = int(line.scene)
+        elif line.TYPE == Character.TYPE:
+            character = line.character
+        elif line.TYPE == Dialogue.TYPE:
+            act, scene = int(line.act), int(line.scene)
+            character, text = line.character, line.dialogue
+        else:
+            character, text = line.default_character, line.raw
+        yield i, line.TYPE, character, act, scene, text
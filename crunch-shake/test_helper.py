@@ -0,0 +1,97 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import helper
+
+"""
+Downloads by `helper.download_plays` from a local server, whose responses
+to each play are queued up by the test.
+"""
+
+class Handler(BaseHTTPRequestHandler):
+    # maps each path to a list of (status, body), served in turn, a status
+    # of None dropping the connection without a response
+    responses = dict()
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        status, body = self.responses[self.path].pop(0)
+        if status is None:
+            self.close_connection = True
+            return
+        self.send_response(status)
+        if status == 200:
+            self.send_header('ETag', '"' + helper.file_hash(body) + '"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(helper.time, 'sleep', lambda seconds: None)
+    Handler.responses.clear()
+    Handler.requests.clear()
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{0}/'.format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+def download(base_url, plays_dir, **kwargs):
+    return helper.download_plays(['hamlet'], str(plays_dir),
+            base_url=base_url, jobs=1, retries=2, timeout=5, **kwargs)
+
+def read(plays_dir):
+    with open(os.path.join(str(plays_dir), 'hamlet.html'), 'rb') as play:
+        return play.read()
+
+def test_download_then_unchanged(server, tmp_path):
+    Handler.responses['/hamlet/full.html'] = [(200, b'<html>1</html>'),
+            (304, b'')]
+    assert download(server, tmp_path) == {'hamlet' : 'downloaded'}
+    assert read(tmp_path) == b'<html>1</html>'
+    assert download(server, tmp_path) == {'hamlet' : 'unchanged'}
+    # the second request is conditional on the first's ETag
+    etag = '"' + helper.file_hash(b'<html>1</html>') + '"'
+    assert Handler.requests[1] == ('/hamlet/full.html', etag)
+    assert read(tmp_path) == b'<html>1</html>'
+
+def test_server_error_retried(server, tmp_path):
+    Handler.responses['/hamlet/full.html'] = [(503, b''), (None, b''),
+            (200, b'<html>1</html>')]
+    assert download(server, tmp_path) == {'hamlet' : 'downloaded'}
+    assert len(Handler.requests) == 3
+
+def test_failed_after_retries(server, tmp_path):
+    Handler.responses['/hamlet/full.html'] = [(500, b'')] * 3
+    status = download(server, tmp_path)['hamlet']
+    assert status.startswith('failed')
+    assert not os.path.exists(os.path.join(str(tmp_path), 'hamlet.html'))
+
+def test_edited_kept(server, tmp_path):
+    Handler.responses['/hamlet/full.html'] = [(200, b'<html>1</html>'),
+            (200, b'<html>2</html>'), (200, b'<html>2</html>')]
+    download(server, tmp_path)
+    with open(os.path.join(str(tmp_path), 'hamlet.html'), 'wb') as play:
+        play.write(b'<html>edited</html>')
+    assert download(server, tmp_path) == {'hamlet' : 'kept'}
+    assert read(tmp_path) == b'<html>edited</html>'
+    assert download(server, tmp_path, overwrite=True) == {
+            'hamlet' : 'downloaded'}
+    assert read(tmp_path) == b'<html>2</html>'
+
+def test_unrecorded_kept(server, tmp_path):
+    # as the plays in the repository, which have no download record
+    Handler.responses['/hamlet/full.html'] = [(200, b'<html>1</html>')]
+    with open(os.path.join(str(tmp_path), 'hamlet.html'), 'wb') as play:
+        play.write(b'<html>by hand</html>')
+    assert download(server, tmp_path) == {'hamlet' : 'kept'}
+    assert read(tmp_path) == b'<html>by hand</html>'
@@ -0,0 +1,33 @@
+from lines import Instruction
+from mit_shakespeare_regex import matcher
+from parse import parse_play
+from playfile import write_play, read_play
+from table import PlayTable
+from utils import file_to_list
+
+"""
+Plays written by `playfile.write_play` read back as the lines written.
+"""
+
+def get_play_lines():
+    _, play_lines = parse_play(file_to_list('plays/hamlet.html'), matcher)
+    return play_lines
+
+def copy_instructions(play_lines):
+    """ play_lines with every instruction a fresh tuple, as a generator,
+    so that earlier ones may be freed while writing """
+    for line in play_lines:
+        if line.TYPE == Instruction.TYPE:
+            yield Instruction(*line)
+        elif getattr(line, 'instruction', None):
+            yield line._replace(instruction=Instruction(*line.instruction))
+        else:
+            yield line
+
+def test_round_trip(tmp_path):
+    play_lines = get_play_lines()
+    path = str(tmp_path / 'hamlet.play')
+    for lines in [play_lines, PlayTable(play_lines),
+            copy_instructions(play_lines)]:
+        write_play(path, lines)
+        assert list(read_play(path)) == play_lines
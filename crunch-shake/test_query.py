@@ -0,0 +1,31 @@
+import sqlite3
+
+import pytest
+
+import query
+
+"""
+Databases opened read only by `query.connect`, at paths with characters
+that mean something in a URI.
+"""
+
+@pytest.mark.parametrize('name', ['plays?mode=rw.sqlite', 'plays#1.sqlite',
+    'plays%3F.sqlite', 'my plays.sqlite'])
+def test_connect(tmp_path, name):
+    path = tmp_path / name
+    connection = sqlite3.connect(str(path))
+    with connection:
+        connection.execute("CREATE TABLE plays (name TEXT)")
+        connection.execute("INSERT INTO plays VALUES ('hamlet')")
+    connection.close()
+
+    connection = query.connect(str(path))
+    try:
+        assert query.query(connection, "SELECT name FROM plays") == (
+                ['name'], [('hamlet',)])
+        with pytest.raises(sqlite3.OperationalError):
+            connection.execute("INSERT INTO plays VALUES ('macbeth')")
+    finally:
+        connection.close()
+    # nothing opened or created at any other path
+    assert [ p.name for p in tmp_path.iterdir() ] == [name]
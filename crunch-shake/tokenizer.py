@@ -0,0 +1,110 @@
+import html
+import re
+from collections import Counter
+
+"""
+TOKENIZER
+=========
+
+Splits dialogue into words with a single compiled regex, after decoding any
+HTML entities and folding case, with optional stopword removal and stemming.
+Used for counting vocabulary (see vocab.py) and for finding forbidden words in
+the Bechdel test (see `analysis.create_forbidden_tagger`).
+"""
+
+# Words, keeping contractions such as o'er and 'tis (bar the leading
+# apostrophe) together
+WORD_PATTERN = r"\w+(?:'\w+)*"
+# Words, splitting at apostrophes, so that a possessive such as Hamlet's gives
+# Hamlet
+PLAIN_WORD_PATTERN = r"\w+"
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her him his i if in is
+it its me my no nor not of on or our she so that the their them they this to
+was we were what when which who will with would you your thou thee thy thine
+""".split())
+
+SUFFIXES = ['ing', 'edst', 'est', 'eth', 'ed', 'ly', 'es', 's']
+
+def simple_stem(word):
+    """ Strip the first matching suffix in SUFFIXES, as long as at least
+    three letters remain. Crude, but cheap and without dependencies. """
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def create_tokenizer(pattern=WORD_PATTERN, fold_case=True,
+        decode_entities=True, stopwords=None, stem=None):
+    """
+    Parameters
+    ----------
+    pattern : str
+        regex matching a single word
+    fold_case : bool
+        casefold words, so that matching is case insensitive
+    decode_entities : bool
+        decode HTML entities, e.g. &amp; to &, before splitting
+    stopwords : set of str, optional
+        words to leave out, e.g. STOPWORDS, after folding case
+    stem : function, optional
+        applied to each word after removing stopwords, e.g. simple_stem
+
+    Returns
+    -------
+    tokenize : function
+        tokenize(text) returns the list of words in text
+    """
+    findall = re.compile(pattern).findall
+    def tokenize(text):
+        if decode_entities and '&' in text:
+            text = html.unescape(text)
+        if fold_case:
+            text = text.casefold()
+        words = findall(text)
+        if stopwords:
+            words = [ word for word in words if word not in stopwords ]
+        if stem:
+            words = [ stem(word) for word in words ]
+        return words
+    return tokenize
+
+def count_words(texts, tokenize):
+    """ Counter of the words of all of texts, tokenized in one go """
+    return Counter(tokenize(" ".join(texts)))
+
+def create_phrase_tagger(phrase_tags, tokenize):
+    """ Tag text with every phrase it contains.
+
+    Parameters
+    ----------
+    phrase_tags : dict
+        maps each phrase (a word or words, such as a character's name) to an
+        iterable of its tags
+    tokenize : function
+        as returned by `create_tokenizer`, used for both the phrases and the
+        text, so a phrase is found wherever its words are found in a row
+
+    Returns
+    -------
+    tag : function
+        tag(text) returns the set of tags of all the phrases in text
+    """
+    phrases_by_first_word = dict()
+    for phrase, tags in phrase_tags.items():
+        words = tuple(tokenize(phrase))
+        if words:
+            phrases_by_first_word.setdefault(words[0], []).append(
+                    (words, set(tags)))
+
+    def tag(text):
+        found = set()
+        words = tokenize(text)
+        for i, word in enumerate(words):
+            for phrase, tags in phrases_by_first_word.get(word, ()):
+                if len(phrase) == 1 or tuple(words[i:i + len(phrase)]) == \
+                        phrase:
+                    found |= tags
+        return found
+    return tag
@@ -0,0 +1,76 @@
+import re
+
+"""
+TRIE MATCHER
+============
+
+Compiles a list of words into a single regex whose alternation is factored by
+common prefix, so that each position in the searched text is checked against
+at most one branch per character rather than against every word in turn.
+
+For example the words 'Lord', 'Lords', 'Lorenzo' and 'Lucio' give
+
+    (?<!\\w)(?P<name>l(?:or(?:d(?:s)?|enzo)|ucio))(?!\\w)
+
+Words are escaped, only match as whole words, and where one word is the
+prefix of another the longest one that matches is preferred. A word may be
+followed by a plural 's' or 'es', outside of the group, so that 'Enter
+Soldiers' mentions SOLDIER, as it did when names were matched anywhere in a
+word.
+"""
+
+END = None
+
+def words_to_trie(words):
+    """ Return a nested dict of the lowercased words, with each dict mapping
+    a character to the subtrie of words that continue with it. The key END
+    marks that a word ends at that node."""
+    trie = dict()
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, dict())
+        node[END] = True
+    return trie
+
+def trie_to_pattern(trie):
+    """ Return a regex pattern, without any capturing groups, that matches
+    exactly the words in the trie, longest first. """
+    branches = [ re.escape(char) + trie_to_pattern(trie[char])
+            for char in sorted(key for key in trie if key is not END) ]
+    if not branches:
+        return ''
+    if len(branches) == 1:
+        body = branches[0]
+        grouped = len(body) == 1 or (len(body) == 2 and body[0] == '\\')
+    else:
+        body = '(?:' + '|'.join(branches) + ')'
+        grouped = True
+    if END in trie:
+        # Greedy, so continuing the word is tried before stopping here.
+        return (body if grouped else '(?:' + body + ')') + '?'
+    return body
+
+def get_trie_matcher(words, identifier):
+    """ Compile words into a case insensitive, whole word regex, with a single
+    group named identifier, so that `findall` returns the matched words
+    (without any plural suffix).
+
+    Parameters
+    ----------
+    words : iterable of str
+    identifier : str
+        name of the group containing the matched word
+
+    Notes
+    -----
+    If there are no words the regex will never match.
+    """
+    trie = words_to_trie(words)
+    if not trie:
+        return re.compile("(?P<{0}>(?!))".format(identifier))
+    pattern = r"(?<!\w)(?P<{0}>{1})(?:e?s)?(?!\w)".format(identifier,
+            trie_to_pattern(trie))
+    return re.compile(pattern, re.IGNORECASE)
@@ -3,6 +3,8 @@ import re
 from collections import namedtuple
 import string
 
+from trie import get_trie_matcher
+
 # INPUT OUTPUT
 
 def file_to_list(path):
@@ -25,6 +27,15 @@ def str_to_file(x, path):
     with open(path, 'w') as outputFile:
         outputFile.write(x)
 
+def flatten_stats(play_stats, prefix=''):
+    """ (name, value) of each number in play_stats, nested dicts such as
+    timings being named by their key and the nested key, joined by '.' """
+    for name, value in play_stats.items():
+        if isinstance(value, dict):
+            yield from flatten_stats(value, prefix + name + '.')
+        elif isinstance(value, (int, float)):
+            yield prefix + name, value
+
 # MATCHERS
 
 def get_title(raw_play_lines):
@@ -36,15 +47,13 @@ def get_title(raw_play_lines):
     raise ValueError
 
 def get_matcher(words, identifier):
-    joined_words = "|".join(words)
-    pattern = "(?P<{0}>".format(identifier) + joined_words + ")"
-    matcher = re.compile(
-            pattern,
-            re.IGNORECASE)
-    return matcher
+    """ Case insensitive matcher for any of the words, as whole words,
+    preferring the longest. The matched word is in the group identifier. See
+    trie.py """
+    return get_trie_matcher(words, identifier)
 
 Matcher = namedtuple('Matcher', ['dialogue', 'character', 'stage_direction',
-    'instruction', 'act', 'scene'])
+    'instruction', 'act', 'scene', 'line'])
 
 # HELPERS
 
@@ -0,0 +1,219 @@
+import argparse
+import glob
+import os
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+from utils import file_to_list, json_file_to_dict
+from mit_shakespeare_regex import matcher
+from parse import preprocess
+from table import iter_dialogue
+from tokenizer import create_tokenizer, count_words
+
+"""
+VOCABULARY INDEX
+================
+
+Word counts for every speaking character of every play, as a sparse
+(character x term) matrix over interned term ids, with a (play x term) matrix
+summed from it. Built once over the corpus, counts can then be queried per
+play, per character or per gender, and the gendered vocabulary ratios of
+`analysis.vocab_difference` computed as array operations, without
+tokenizing the plays again.
+"""
+
+class VocabIndex:
+    """ Parameters
+    ----------
+    tokenize : function, optional
+        splits dialogue into words, by default `tokenizer.create_tokenizer()`
+
+    Attributes
+    ----------
+    terms : list of str
+        the term with each id
+    term_id : dict
+        maps a term to its id
+    plays : list of str
+    characters : list of tuples
+        (play index, character name) of each row of character_term
+    genders : list of str
+        gender letter of each row of character_term
+    character_term : scipy.sparse.csr_matrix
+        count of each term spoken by each character
+    play_term : scipy.sparse.csr_matrix
+        count of each term spoken in each play
+    """
+    def __init__(self, tokenize=None):
+        self.terms = []
+        self.term_id = dict()
+        self.plays = []
+        self.characters = []
+        self.genders = []
+        # (row, column, count) triples of character_term, as added
+        self._rows = array('q')
+        self._columns = array('q')
+        self._counts = array('q')
+        self._character_term = None
+        self.tokenize = tokenize or create_tokenizer()
+
+    def add_play(self, play_name, play_lines, gender):
+        """ Count the words of every line of dialogue in play_lines, all the
+        dialogue of each character being tokenized and counted in one go """
+        play = len(self.plays)
+        self.plays.append(play_name)
+        dialogue_by_character = dict()
+        for _, character, dialogue in iter_dialogue(play_lines):
+            dialogue_by_character.setdefault(character, []).append(dialogue)
+        term_id = self.term_id
+        for character, dialogue in dialogue_by_character.items():
+            row = len(self.characters)
+            self.characters.append((play, character))
+            self.genders.append(gender[character])
+            for word, count in count_words(dialogue, self.tokenize).items():
+                if word not in term_id:
+                    term_id[word] = len(self.terms)
+                    self.terms.append(word)
+                self._rows.append(row)
+                self._columns.append(term_id[word])
+                self._counts.append(count)
+        self._character_term = None
+
+    @property
+    def character_term(self):
+        if self._character_term is None:
+            shape = (len(self.characters), len(self.terms))
+            # duplicate triples are summed
+            self._character_term = sparse.csr_matrix(
+                    (np.array(self._counts, dtype=np.int64),
+                        (np.array(self._rows, dtype=np.int64),
+                            np.array(self._columns, dtype=np.int64))),
+                    shape=shape)
+        return self._character_term
+
+    @property
+    def play_term(self):
+        plays = np.array([ play for play, _ in self.characters ], dtype=int)
+        character_play = sparse.csr_matrix(
+                (np.ones(len(plays), dtype=np.int64),
+                    (plays, np.arange(len(plays)))),
+                shape=(len(self.plays), len(self.characters)))
+        return character_play.dot(self.character_term).tocsr()
+
+    def select(self, play=None, character=None, gender=None):
+        """ Boolean mask of the rows of character_term matching every given
+        filter """
+        mask = np.ones(len(self.characters), dtype=bool)
+        if play is not None:
+            play_index = self.plays.index(play)
+            mask &= np.array([ p == play_index for p, _ in self.characters ],
+                    dtype=bool)
+        if character is not None:
+            mask &= np.array([ c == character for _, c in self.characters ],
+                    dtype=bool)
+        if gender is not None:
+            mask &= np.array(self.genders) == gender
+        return mask
+
+    def counts(self, play=None, character=None, gender=None):
+        """ Array of the count of each term, summed over the matching rows """
+        mask = self.select(play, character, gender)
+        return np.asarray(self.character_term[mask].sum(axis=0)).ravel()
+
+    def word_gender(self, play=None):
+        """ Vectorized `analysis.vocab_difference`. Returns a dict that
+        associates each word spoken by males or females with whether it is
+        used more frequently by males (positive) or females (negative), if it
+        is used more often than the average word, else 0. """
+        male = self.counts(play, gender='M').astype(float)
+        female = self.counts(play, gender='F').astype(float)
+        # The 1 is arbitrary as there are no vocab to test against it.
+        male_threshold = male.sum() / np.count_nonzero(male) \
+                if male.any() else 1
+        female_threshold = female.sum() / np.count_nonzero(female) \
+                if female.any() else 1
+        norm_male = male / male.sum() if male.any() else male
+        norm_female = female / female.sum() if female.any() else female
+        spoken = np.flatnonzero((male > 0) | (female > 0))
+        norm_male, norm_female = norm_male[spoken], norm_female[spoken]
+        ratio = (norm_male - norm_female) / (norm_male + norm_female)
+        meet_threshold = (male[spoken] > male_threshold) \
+                | (female[spoken] > female_threshold)
+        metric = np.where(meet_threshold, ratio, 0)
+        return dict(zip([ self.terms[i] for i in spoken ], metric.tolist()))
+
+    def save(self, path):
+        matrix = self.character_term
+        np.savez_compressed(path,
+                terms=np.array(self.terms, dtype=str),
+                plays=np.array(self.plays, dtype=str),
+                character_plays=np.array([ p for p, _ in self.characters ],
+                    dtype=int),
+                character_names=np.array([ c for _, c in self.characters ],
+                    dtype=str),
+                genders=np.array(self.genders, dtype=str),
+                data=matrix.data, indices=matrix.indices,
+                indptr=matrix.indptr, shape=np.array(matrix.shape))
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with np.load(path) as saved:
+            index.terms = saved['terms'].tolist()
+            index.term_id = { term : i for i, term in enumerate(index.terms) }
+            index.plays = saved['plays'].tolist()
+            index.characters = list(zip(saved['character_plays'].tolist(),
+                saved['character_names'].tolist()))
+            index.genders = saved['genders'].tolist()
+            matrix = sparse.csr_matrix(
+                    (saved['data'], saved['indices'], saved['indptr']),
+                    shape=tuple(saved['shape'])).tocoo()
+        index._rows = array('q', matrix.row.tolist())
+        index._columns = array('q', matrix.col.tolist())
+        index._counts = array('q', matrix.data.tolist())
+        return index
+
+def build_index(play_paths):
+    """ VocabIndex of every play in play_paths, with gender read from the
+    gender directory next to the plays' directory """
+    index = VocabIndex()
+    for play_path in play_paths:
+        head_dir = os.path.dirname(os.path.dirname(os.path.abspath(
+            play_path)))
+        play_name = os.path.basename(play_path)[:-len('.html')]
+        gender = json_file_to_dict(os.path.join(head_dir, 'gender',
+            play_name + '.gender'))
+        _, play_lines = preprocess(file_to_list(play_path), matcher)
+        index.add_play(play_name, play_lines, gender)
+    return index
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+            description="Build or query the corpus vocabulary index")
+    parser.add_argument('--index', default='vocab.npz',
+            help="index file, built if it does not exist")
+    parser.add_argument('--plays', default='plays/*.html',
+            help="glob of the plays to build the index from")
+    parser.add_argument('--play', default=None,
+            help="only query this play, e.g. hamlet")
+    parser.add_argument('--top', type=int, default=25,
+            help="number of most female and most male words to show")
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    if os.path.exists(args.index):
+        index = VocabIndex.load(args.index)
+    else:
+        index = build_index(sorted(glob.glob(args.plays)))
+        index.save(args.index)
+    word_gender = index.word_gender(args.play)
+    word_gender_sorted = sorted(word_gender, key=lambda x: word_gender[x])
+    print(word_gender_sorted[:args.top])
+    print(word_gender_sorted[-args.top:])
+
+
+if __name__ == "__main__":
+    main()